@@ -1,6 +1,11 @@
 from datetime import datetime, timedelta
+import hashlib
+import threading
+import time
 from typing import Optional
 
+from cachetools import TLRUCache
+
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
@@ -15,7 +20,11 @@ from database import get_db
 
 load_dotenv()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt work factor; lower it (e.g. BCRYPT_ROUNDS=4) for local development and tests.
+# Existing hashes keep verifying at whatever cost they were created with.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your-super-secret-key-replace-me")
 ALGORITHM = "HS256"
@@ -23,9 +32,23 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Authenticated users keyed by a digest of the bearer token, so repeat requests skip the JWT decode
+# and the users lookup. Entries live until the token expires, capped so a deactivated user or
+# changed role is picked up within a few minutes. Values are (expires_at, user).
+CURRENT_USER_CACHE_MAX_TTL_SECONDS = 5 * 60
+_current_user_cache = TLRUCache(maxsize=10_000, ttu=lambda _key, value, _now: value[0], timer=time.time)
+_current_user_cache_lock = threading.Lock()
+
+def _token_cache_key(token: str) -> str:
+    return hashlib.blake2b(token.encode(), digest_size=16).hexdigest() # Don't keep raw tokens in memory
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
+def dummy_verify_password():
+    """Burns the same bcrypt time as a real check, so logins for unknown emails can't be spotted by response time."""
+    pwd_context.dummy_verify()
+
 def get_password_hash(password):
     return pwd_context.hash(password)
 
@@ -52,6 +75,12 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    cache_key = _token_cache_key(token)
+    with _current_user_cache_lock:
+        cached = _current_user_cache.get(cache_key)
+    if cached is not None:
+        return cached[1]
+
     payload = decode_access_token(token)
     if payload is None:
         raise credentials_exception
@@ -63,7 +92,12 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if user is None:
         raise credentials_exception
-    
+
+    # Detach so the cached instance isn't expired by commits in this request's session
+    db.expunge(user)
+    expires_at = min(time.time() + CURRENT_USER_CACHE_MAX_TTL_SECONDS, payload.get("exp", 0))
+    with _current_user_cache_lock:
+        _current_user_cache[cache_key] = (expires_at, user)
     return user
 
 def get_current_active_user(current_user: models.User = Depends(get_current_user)):
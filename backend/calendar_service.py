@@ -1,73 +1,366 @@
 # backend/calendar_service.py
 import os.path
+import asyncio
+import concurrent.futures
 import datetime
+import functools
 import logging
-import json # NEW: To parse JSON string from environment variable
+import random
+import threading
+import time
+import uuid
+from urllib.parse import quote
+from zoneinfo import ZoneInfo
+
+import httpx
+import httplib2
+import orjson
+from cachetools import TTLCache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # google.auth modules for Service Account
-from google.auth.transport.requests import Request
+from google.auth.exceptions import GoogleAuthError
+from google.auth.transport.requests import AuthorizedSession, Request
 from google.oauth2.service_account import Credentials as ServiceAccountCredentials # MODIFIED IMPORT: Use this for service account auth
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
 from googleapiclient.errors import HttpError
+from googleapiclient.http import set_user_agent
+
+try:
+    import redis # Optional: shares the free/busy cache across worker processes when REDIS_URL is set
+    import redis.asyncio as aioredis
+except ImportError:
+    redis = None
+    aioredis = None
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 SCOPES = ['https://www.googleapis.com/auth/calendar.events']
 GOOGLE_SERVICE_ACCOUNT_CREDENTIALS_JSON = os.getenv("GOOGLE_SERVICE_ACCOUNT_CREDENTIALS_JSON")
+CALENDAR_API_BASE_URL = 'https://www.googleapis.com/calendar/v3'
+# Google only gzips responses for clients whose user agent contains "gzip"
+GOOGLE_API_USER_AGENT = 'smart-doctor-assistant/1.0 (gzip)'
+BATCH_MAX_REQUESTS = 50 # Google's per-batch limit for the Calendar API
+FREE_BUSY_CACHE_TTL_SECONDS = 30
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+MAX_API_TRIES = 5
+REDIS_URL = os.getenv("REDIS_URL")
+CALENDAR_TIMEZONE_NAME = 'Asia/Kolkata' # Clinic time: naive datetimes passed to this module are in this zone
+CALENDAR_TIMEZONE = ZoneInfo(CALENDAR_TIMEZONE_NAME)
+
+LOCAL_SERVICE_ACCOUNT_KEY_FILE = 'service_account_key.json' # Make sure this file is in backend/ and in .gitignore
+
+
+def _load_creds_info():
+    """Loads the service account credentials info from the environment variable or the local key file."""
+    # Priority 1: Try to load credentials from environment variable (for deployment)
+    if GOOGLE_SERVICE_ACCOUNT_CREDENTIALS_JSON:
+        try:
+            creds_info = orjson.loads(GOOGLE_SERVICE_ACCOUNT_CREDENTIALS_JSON)
+            logger.info("Loaded Google service account credentials from environment variable.")
+            return creds_info
+        except orjson.JSONDecodeError as e:
+            logger.error("Error decoding GOOGLE_SERVICE_ACCOUNT_CREDENTIALS_JSON (from env var): %s. Check JSON format in environment variable.", e)
+
+    # Priority 2: If not from env var, try to load credentials from local file (for local development/testing)
+    # This block is added for local flexibility; Render will use the env var
+    if os.path.exists(LOCAL_SERVICE_ACCOUNT_KEY_FILE):
+        try:
+            with open(LOCAL_SERVICE_ACCOUNT_KEY_FILE, "rb") as f:
+                creds_info = orjson.loads(f.read())
+            logger.info("Loaded Google service account credentials from local file: %s.", LOCAL_SERVICE_ACCOUNT_KEY_FILE)
+            return creds_info
+        except (FileNotFoundError, orjson.JSONDecodeError) as e:
+            logger.error("Error loading local service account key file '%s': %s. Check file path/JSON format.", LOCAL_SERVICE_ACCOUNT_KEY_FILE, e)
+            return None
+
+    logger.warning("Neither GOOGLE_SERVICE_ACCOUNT_CREDENTIALS_JSON env var nor local file '%s' found. Google Calendar service cannot be initialized.", LOCAL_SERVICE_ACCOUNT_KEY_FILE)
+    return None
+
+
+# Parsed once at import so service (re)initialization never touches disk or re-parses JSON
+_CREDS_INFO = _load_creds_info()
+_CALENDAR_ENABLED = _CREDS_INFO is not None
+# Discovery document bundled with google-api-python-client; avoids the discovery HTTP fetch entirely
+_CALENDAR_DISCOVERY_DOC = orjson.loads(get_static_doc('calendar', 'v3'))
 
 calendar_service = None
+_authorized_session = None
+_init_lock = threading.Lock()
+
+
+class _SessionHttp:
+    """httplib2-compatible adapter so googleapiclient sends its requests over a pooled AuthorizedSession."""
+
+    def __init__(self, session):
+        self.session = session
+
+    def request(self, uri, method="GET", body=None, headers=None, redirections=5, connection_type=None):
+        response = self.session.request(method, uri, data=body, headers=headers, timeout=30)
+        return httplib2.Response({"status": response.status_code, **response.headers}), response.content
+
+
+def _build_authorized_session(creds):
+    """Creates a requests session that reuses pooled TLS connections to googleapis.com across Calendar calls."""
+    session = AuthorizedSession(creds)
+    retries = Retry(total=3, backoff_factor=0.2, status_forcelist=[429, 500, 502, 503, 504])
+    session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=64, max_retries=retries))
+    return session
 
 def get_calendar_service():
     """Initializes and returns the Google Calendar API service, handling authentication using a Service Account."""
-    global calendar_service
+    global calendar_service, _authorized_session
     if calendar_service:
         return calendar_service
 
-    # --- MODIFIED LOGIC: Use Service Account credentials from environment variable ---
-    creds_info = None
+    if not _CALENDAR_ENABLED:
+        logger.warning("No valid Google Calendar credentials found or loaded. Calendar features will be limited.")
+        return None
 
-    # Priority 1: Try to load credentials from environment variable (for deployment)
-    if GOOGLE_SERVICE_ACCOUNT_CREDENTIALS_JSON:
-        try:
-            creds_info = json.loads(GOOGLE_SERVICE_ACCOUNT_CREDENTIALS_JSON)
-            logger.info("Attempting to initialize Google Calendar service from environment variable.")
-        except json.JSONDecodeError as e:
-            logger.error(f"Error decoding GOOGLE_SERVICE_ACCOUNT_CREDENTIALS_JSON (from env var): {e}. Check JSON format in environment variable.")
-            creds_info = None # Reset to None if decoding fails
-    
-    # Priority 2: If not from env var, try to load credentials from local file (for local development/testing)
-    # This block is added for local flexibility; Render will use the env var
-    local_service_account_key_file_path = 'service_account_key.json' # Make sure this file is in backend/ and in .gitignore
-    if not creds_info:
-        if os.path.exists(local_service_account_key_file_path):
-            try:
-                with open(local_service_account_key_file_path, "r") as f:
-                    creds_info = json.load(f)
-                logger.info(f"Attempting to initialize Google Calendar service from local file: {local_service_account_key_file_path}.")
-            except (FileNotFoundError, json.JSONDecodeError) as e:
-                logger.error(f"Error loading local service account key file '{local_service_account_key_file_path}': {e}. Check file path/JSON format.")
-                creds_info = None
-        else:
-            logger.warning(f"Neither GOOGLE_SERVICE_ACCOUNT_CREDENTIALS_JSON env var nor local file '{local_service_account_key_file_path}' found. Google Calendar service cannot be initialized.")
-            return None # Fail gracefully if no credentials source found
+    with _init_lock:
+        # Re-check under the lock: another thread may have built the service while we waited
+        if calendar_service:
+            return calendar_service
 
-    # If credentials info is successfully obtained, try to build the service
-    if creds_info:
         try:
-            # Use the imported ServiceAccountCredentials class
             creds = ServiceAccountCredentials.from_service_account_info(
-                creds_info, scopes=SCOPES
+                _CREDS_INFO, scopes=SCOPES
             )
-            calendar_service = build('calendar', 'v3', credentials=creds)
+            _authorized_session = _build_authorized_session(creds)
+            http = set_user_agent(_SessionHttp(_authorized_session), GOOGLE_API_USER_AGENT)
+            calendar_service = build_from_document(_CALENDAR_DISCOVERY_DOC, http=http)
             logger.info("Google Calendar service initialized successfully using Service Account credentials.")
             return calendar_service
         except Exception as e:
-            logger.error(f"An error occurred during Google Calendar service build with Service Account: {e}")
+            logger.error("An error occurred during Google Calendar service build with Service Account: %s", e)
             return None
+
+
+# --- Free/busy cache ---
+# Repeated availability lookups for the same calendar window within a few seconds are common
+# (the agent checks a slot, then books it), so serve them from a short-lived cache.
+_free_busy_cache = TTLCache(maxsize=4096, ttl=FREE_BUSY_CACHE_TTL_SECONDS)
+_free_busy_cache_lock = threading.Lock()
+_redis_client = None # Sync client, for the blocking paths (batch requests run on _GCAL_EXECUTOR)
+_aredis_client = None # redis.asyncio client, for the coroutines so Redis round trips don't block the event loop
+if REDIS_URL:
+    if redis is None:
+        logger.warning("REDIS_URL is set but the 'redis' package is not installed. Using the in-process free/busy cache only.")
     else:
-        logger.warning("No valid Google Calendar credentials found or loaded. Calendar features will be limited.")
+        _redis_client = redis.Redis.from_url(REDIS_URL)
+        _aredis_client = aioredis.Redis.from_url(REDIS_URL)
+
+def _to_aware(value: datetime.datetime) -> datetime.datetime:
+    """Attaches the clinic time zone to a naive datetime; aware datetimes are returned unchanged."""
+    return value if value.tzinfo is not None else value.replace(tzinfo=CALENDAR_TIMEZONE)
+
+
+def _to_utc(value: datetime.datetime) -> datetime.datetime:
+    """Normalises a window bound for cache keys and overlap checks (naive = clinic-local, as in request bodies)."""
+    return _to_aware(value).astimezone(datetime.timezone.utc)
+
+
+# Windows are keyed by their bounds in aware UTC, so clinic-local and UTC callers agree.
+# Redis layout: one string key per cached window, plus a per-calendar set of "start|end" window
+# names, so invalidation reads one small set instead of SCANning the keyspace.
+def _free_busy_window(start_time: datetime.datetime, end_time: datetime.datetime) -> str:
+    return f"{start_time.isoformat()}|{end_time.isoformat()}"
+
+
+def _free_busy_redis_key(calendar_id: str, window: str) -> str:
+    return f"gcal:fb:{calendar_id}:{window}"
+
+
+def _free_busy_index_key(calendar_id: str) -> str:
+    return f"gcal:fb-windows:{calendar_id}"
+
+
+def _overlapping_windows(windows, start_time: datetime.datetime, end_time: datetime.datetime) -> list:
+    """Window names (from the per-calendar index set) that overlap [start_time, end_time)."""
+    overlapping = []
+    for window in windows:
+        window = window.decode() if isinstance(window, bytes) else window
+        window_start, window_end = (datetime.datetime.fromisoformat(part) for part in window.split("|"))
+        if window_start < end_time and start_time < window_end:
+            overlapping.append(window)
+    return overlapping
+
+
+def _get_local_busy(calendar_id: str, start_time: datetime.datetime, end_time: datetime.datetime):
+    with _free_busy_cache_lock:
+        return _free_busy_cache.get((calendar_id, start_time, end_time))
+
+
+def _set_local_busy(calendar_id: str, start_time: datetime.datetime, end_time: datetime.datetime, busy: list):
+    with _free_busy_cache_lock:
+        _free_busy_cache[(calendar_id, start_time, end_time)] = busy
+
+
+def _invalidate_local_busy(calendar_id: str, start_time: datetime.datetime, end_time: datetime.datetime):
+    with _free_busy_cache_lock:
+        stale_keys = [
+            key for key in list(_free_busy_cache.keys())
+            if key[0] == calendar_id and key[1] < end_time and start_time < key[2]
+        ]
+        for key in stale_keys:
+            _free_busy_cache.pop(key, None)
+
+
+def _get_cached_busy(calendar_id: str, start_time: datetime.datetime, end_time: datetime.datetime):
+    """Returns the cached busy list for a calendar window, or None on a cache miss. Blocking; use from threads."""
+    start_time, end_time = _to_utc(start_time), _to_utc(end_time)
+    busy = _get_local_busy(calendar_id, start_time, end_time)
+    if busy is not None or _redis_client is None:
+        return busy
+
+    try:
+        raw = _redis_client.get(_free_busy_redis_key(calendar_id, _free_busy_window(start_time, end_time)))
+    except redis.RedisError as e:
+        logger.error("Error reading free/busy cache from Redis: %s", e)
         return None
+    if raw is None:
+        return None
+
+    busy = orjson.loads(raw)
+    _set_local_busy(calendar_id, start_time, end_time, busy)
+    return busy
+
+
+async def _aget_cached_busy(calendar_id: str, start_time: datetime.datetime, end_time: datetime.datetime):
+    """Async variant of `_get_cached_busy`."""
+    start_time, end_time = _to_utc(start_time), _to_utc(end_time)
+    busy = _get_local_busy(calendar_id, start_time, end_time)
+    if busy is not None or _aredis_client is None:
+        return busy
+
+    try:
+        raw = await _aredis_client.get(_free_busy_redis_key(calendar_id, _free_busy_window(start_time, end_time)))
+    except redis.RedisError as e:
+        logger.error("Error reading free/busy cache from Redis: %s", e)
+        return None
+    if raw is None:
+        return None
+
+    busy = orjson.loads(raw)
+    _set_local_busy(calendar_id, start_time, end_time, busy)
+    return busy
+
+
+def _queue_set_busy(pipe, calendar_id: str, start_time: datetime.datetime, end_time: datetime.datetime, busy: list):
+    """Queues the Redis writes for one cached window on a (sync or async) pipeline."""
+    window = _free_busy_window(start_time, end_time)
+    pipe.setex(_free_busy_redis_key(calendar_id, window), FREE_BUSY_CACHE_TTL_SECONDS, orjson.dumps(busy))
+    pipe.sadd(_free_busy_index_key(calendar_id), window)
+    # The index outlives every window it lists; names of already-expired windows are harmless
+    pipe.expire(_free_busy_index_key(calendar_id), FREE_BUSY_CACHE_TTL_SECONDS)
+
+
+def _set_cached_busy(calendar_id: str, start_time: datetime.datetime, end_time: datetime.datetime, busy: list):
+    """Caches a calendar window's busy list. Blocking; use from threads."""
+    start_time, end_time = _to_utc(start_time), _to_utc(end_time)
+    _set_local_busy(calendar_id, start_time, end_time, busy)
+    if _redis_client is not None:
+        try:
+            with _redis_client.pipeline() as pipe:
+                _queue_set_busy(pipe, calendar_id, start_time, end_time, busy)
+                pipe.execute()
+        except redis.RedisError as e:
+            logger.error("Error writing free/busy cache to Redis: %s", e)
+
+
+async def _aset_cached_busy(calendar_id: str, start_time: datetime.datetime, end_time: datetime.datetime, busy: list):
+    """Async variant of `_set_cached_busy`."""
+    start_time, end_time = _to_utc(start_time), _to_utc(end_time)
+    _set_local_busy(calendar_id, start_time, end_time, busy)
+    if _aredis_client is not None:
+        try:
+            async with _aredis_client.pipeline() as pipe:
+                _queue_set_busy(pipe, calendar_id, start_time, end_time, busy)
+                await pipe.execute()
+        except redis.RedisError as e:
+            logger.error("Error writing free/busy cache to Redis: %s", e)
+
+
+def _invalidate_cached_busy(calendar_id: str, start_time: datetime.datetime, end_time: datetime.datetime):
+    """Drops cached free/busy windows of a calendar that overlap a newly created event. Blocking; use from threads."""
+    start_time, end_time = _to_utc(start_time), _to_utc(end_time)
+    _invalidate_local_busy(calendar_id, start_time, end_time)
+    if _redis_client is not None:
+        try:
+            stale = _overlapping_windows(_redis_client.smembers(_free_busy_index_key(calendar_id)), start_time, end_time)
+            if stale:
+                with _redis_client.pipeline() as pipe:
+                    pipe.delete(*(_free_busy_redis_key(calendar_id, window) for window in stale))
+                    pipe.srem(_free_busy_index_key(calendar_id), *stale)
+                    pipe.execute()
+        except redis.RedisError as e:
+            logger.error("Error invalidating free/busy cache in Redis: %s", e)
+
+
+async def _ainvalidate_cached_busy(calendar_id: str, start_time: datetime.datetime, end_time: datetime.datetime):
+    """Async variant of `_invalidate_cached_busy`."""
+    start_time, end_time = _to_utc(start_time), _to_utc(end_time)
+    _invalidate_local_busy(calendar_id, start_time, end_time)
+    if _aredis_client is not None:
+        try:
+            stale = _overlapping_windows(await _aredis_client.smembers(_free_busy_index_key(calendar_id)), start_time, end_time)
+            if stale:
+                async with _aredis_client.pipeline() as pipe:
+                    pipe.delete(*(_free_busy_redis_key(calendar_id, window) for window in stale))
+                    pipe.srem(_free_busy_index_key(calendar_id), *stale)
+                    await pipe.execute()
+        except redis.RedisError as e:
+            logger.error("Error invalidating free/busy cache in Redis: %s", e)
+
+
+def _backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff delay (in seconds) before retry number `attempt + 1`."""
+    return random.uniform(0, 2 ** attempt * 0.25)
+
+
+def _execute_with_retry(request, max_tries: int = MAX_API_TRIES):
+    """Executes a googleapiclient request, retrying rate-limit and transient server errors with jittered backoff."""
+    for attempt in range(max_tries):
+        try:
+            return request.execute()
+        except HttpError as error:
+            if error.resp.status not in RETRYABLE_STATUS_CODES or attempt == max_tries - 1:
+                raise
+            delay = _backoff_delay(attempt)
+            logger.warning("Google Calendar API returned %s, retrying in %.2fs", error.resp.status, delay)
+            time.sleep(delay)
+
+
+# Same for every appointment; shared by reference rather than rebuilt per event
+_EVENT_REMINDERS = {
+    'useDefault': False,
+    'overrides': (
+        {'method': 'email', 'minutes': 24 * 60},
+        {'method': 'popup', 'minutes': 10},
+    ),
+}
+
+
+def _build_event_body(summary: str, description: str, start_datetime: datetime.datetime, end_datetime: datetime.datetime) -> dict:
+    """Builds the JSON body for a Google Calendar event insert."""
+    return {
+        'summary': summary,
+        'description': description,
+        'start': {
+            'dateTime': start_datetime.isoformat(),
+            'timeZone': CALENDAR_TIMEZONE_NAME,
+        },
+        'end': {
+            'dateTime': end_datetime.isoformat(),
+            'timeZone': CALENDAR_TIMEZONE_NAME,
+        },
+        # 'attendees': attendees if attendees else [], # <--- CRITICAL CHANGE: COMMENT OUT OR REMOVE THIS LINE
+        'reminders': _EVENT_REMINDERS,
+        # Google de-duplicates conference creation by requestId, so each event needs its own
+        'conferenceData': {'createRequest': {'requestId': uuid.uuid4().hex}},
+    }
 
 
 def create_calendar_event(
@@ -84,65 +377,284 @@ def create_calendar_event(
         logger.warning("Google Calendar service not available to create event.")
         return None
 
-    event = {
-        'summary': summary,
-        'description': description,
-        'start': {
-            'dateTime': start_datetime.isoformat(),
-            'timeZone': 'Asia/Kolkata',
-        },
-        'end': {
-            'dateTime': end_datetime.isoformat(),
-            'timeZone': 'Asia/Kolkata',
-        },
-        # 'attendees': attendees if attendees else [], # <--- CRITICAL CHANGE: COMMENT OUT OR REMOVE THIS LINE
-        'reminders': {
-            'useDefault': False,
-            'overrides': [
-                {'method': 'email', 'minutes': 24 * 60},
-                {'method': 'popup', 'minutes': 10},
-            ],
-        },
-        'conferenceData': {'createRequest': {'requestId': 'random-string'}},
-    }
+    event = _build_event_body(summary, description, start_datetime, end_datetime)
 
     try:
-        event = service.events().insert(
+        event = _execute_with_retry(service.events().insert(
             calendarId=calendar_id,
             body=event,
             sendNotifications=False, # <--- MODIFIED: Set to False, since we are not inviting attendees via Google. Your app will send the email.
             conferenceDataVersion=1
-        ).execute()
-        logger.info(f"Event created: {event.get('htmlLink')}")
+        ))
+        logger.info("Event created: %s", event.get('htmlLink'))
+        _invalidate_cached_busy(calendar_id, start_datetime, end_datetime)
         return event.get('id')
     except HttpError as error:
-        logger.error(f"An error occurred creating Google Calendar event: {error}")
+        logger.error("An error occurred creating Google Calendar event: %s", error)
         return None
-def get_free_busy_slots(service, calendar_id: str, start_time: datetime.datetime, end_time: datetime.datetime):
-    """Gets free/busy information for a calendar within a time range."""
+
+
+def create_calendar_events_batch(service, requests: list):
+    """
+    Creates several events in as few HTTP round-trips as possible using Google's batch endpoint.
+    Each item in `requests` takes the same keys as `create_calendar_event` (calendar_id, summary,
+    description, start_datetime, end_datetime). Returns the created event IDs in input order,
+    with None for any insert that failed.
+    """
     if not service:
-        logger.warning("Google Calendar service not available to check free/busy slots.")
-        return []
+        logger.warning("Google Calendar service not available to create events.")
+        return [None] * len(requests)
+
+    results = {}
+
+    def _callback(request_id, response, exception):
+        if exception is not None:
+            logger.error("An error occurred creating Google Calendar event in batch (request %s): %s", request_id, exception)
+            results[request_id] = None
+        else:
+            logger.info("Event created: %s", response.get('htmlLink'))
+            results[request_id] = response.get('id')
+
+    for chunk_start in range(0, len(requests), BATCH_MAX_REQUESTS):
+        batch = service.new_batch_http_request(callback=_callback)
+        for i, req in enumerate(requests[chunk_start:chunk_start + BATCH_MAX_REQUESTS], start=chunk_start):
+            body = _build_event_body(req['summary'], req['description'], req['start_datetime'], req['end_datetime'])
+            batch.add(
+                service.events().insert(
+                    calendarId=req['calendar_id'],
+                    body=body,
+                    sendNotifications=False,
+                    conferenceDataVersion=1
+                ),
+                request_id=str(i)
+            )
+        try:
+            batch.execute()
+        except HttpError as error:
+            logger.error("An error occurred executing Google Calendar batch insert: %s", error)
+
+    for i, req in enumerate(requests):
+        if results.get(str(i)):
+            _invalidate_cached_busy(req['calendar_id'], req['start_datetime'], req['end_datetime'])
 
-    body = {
-        "timeMin": start_time.isoformat() + 'Z',
-        "timeMax": end_time.isoformat() + 'Z',
-        "timeZone": 'Asia/Kolkata',
-        "items": [{"id": calendar_id}]
+    return [results.get(str(i)) for i in range(len(requests))]
+
+
+def _build_free_busy_body(calendar_ids: list, start_time: datetime.datetime, end_time: datetime.datetime) -> dict:
+    """Builds the JSON body for a Google Calendar freebusy query."""
+    # RFC 3339 with the real offset; naive times are clinic-local, same as in event bodies
+    return {
+        "timeMin": _to_aware(start_time).isoformat(),
+        "timeMax": _to_aware(end_time).isoformat(),
+        "timeZone": CALENDAR_TIMEZONE_NAME,
+        "items": [{"id": cid} for cid in calendar_ids]
     }
 
+
+def get_free_busy_slots_for_calendars(service, calendar_ids: list, start_time: datetime.datetime, end_time: datetime.datetime) -> dict:
+    """
+    Gets free/busy information for several calendars within a time range using one
+    freebusy query per 50 calendars. Returns a dict mapping each calendar ID to its busy list;
+    calendars whose lookup failed (query error or a per-calendar error from Google) are left out.
+    """
+    if not service:
+        logger.warning("Google Calendar service not available to check free/busy slots.")
+        return {cid: [] for cid in calendar_ids}
+
+    busy_by_calendar = {}
+    uncached_ids = []
+    for cid in calendar_ids:
+        busy = _get_cached_busy(cid, start_time, end_time)
+        if busy is None:
+            uncached_ids.append(cid)
+        else:
+            busy_by_calendar[cid] = busy
+
+    for chunk_start in range(0, len(uncached_ids), BATCH_MAX_REQUESTS):
+        chunk = uncached_ids[chunk_start:chunk_start + BATCH_MAX_REQUESTS]
+        body = _build_free_busy_body(chunk, start_time, end_time)
+
+        try:
+            response = _execute_with_retry(service.freebusy().query(body=body))
+            calendars_data = response.get('calendars', {})
+            for cid in chunk:
+                calendar_data = calendars_data.get(cid)
+                if calendar_data is None or calendar_data.get('errors'):
+                    logger.error("Google Calendar free/busy returned no data for %s: %s", cid, calendar_data)
+                    continue
+                busy_by_calendar[cid] = calendar_data.get('busy', [])
+                _set_cached_busy(cid, start_time, end_time, busy_by_calendar[cid])
+        except HttpError as error:
+            logger.error("An error occurred checking Google Calendar free/busy: %s", error)
+
+    return busy_by_calendar
+
+
+def get_free_busy_slots(service, calendar_id: str, start_time: datetime.datetime, end_time: datetime.datetime):
+    """Gets free/busy information for a calendar within a time range."""
+    return get_free_busy_slots_for_calendars(service, [calendar_id], start_time, end_time).get(calendar_id, [])
+
+# --- Async Calendar client (used from the async agent tools) ---
+# Talks to the Calendar REST API directly over a pooled httpx client so awaiting tools
+# don't pin an event-loop thread for the whole HTTPS round-trip.
+_async_client = None
+_async_creds = None
+# Dedicated pool for the remaining blocking Google calls (token refresh, batch requests)
+_GCAL_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=32, thread_name_prefix="gcal")
+_async_creds_lock = asyncio.Lock()
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    """Returns the shared async HTTP client for Calendar API calls, creating it on first use."""
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(
+            base_url=CALENDAR_API_BASE_URL,
+            headers={"User-Agent": GOOGLE_API_USER_AGENT, "Accept-Encoding": "gzip"},
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=75),
+            timeout=30,
+        )
+    return _async_client
+
+
+async def _get_access_token():
+    """Returns a valid OAuth2 access token for the service account, refreshing it only when it is about to expire."""
+    global _async_creds
+    if not _CALENDAR_ENABLED:
+        return None
+
+    async with _async_creds_lock:
+        if _async_creds is None:
+            _async_creds = ServiceAccountCredentials.from_service_account_info(_CREDS_INFO, scopes=SCOPES)
+        if not _async_creds.valid:
+            # The token endpoint call is blocking; keep it off the event loop
+            await asyncio.get_running_loop().run_in_executor(_GCAL_EXECUTOR, _async_creds.refresh, Request())
+        return _async_creds.token
+
+
+async def _post_with_retry(path: str, token: str, max_tries: int = MAX_API_TRIES, **kwargs) -> httpx.Response:
+    """POSTs to the Calendar API, retrying rate-limit and transient server errors with jittered backoff."""
+    for attempt in range(max_tries):
+        response = await _get_async_client().post(path, headers={"Authorization": f"Bearer {token}"}, **kwargs)
+        if response.status_code not in RETRYABLE_STATUS_CODES or attempt == max_tries - 1:
+            return response
+        delay = _backoff_delay(attempt)
+        logger.warning("Google Calendar API returned %s, retrying in %.2fs", response.status_code, delay)
+        await asyncio.sleep(delay)
+
+
+async def create_calendar_event_async(
+    calendar_id: str,
+    summary: str,
+    description: str,
+    start_datetime: datetime.datetime,
+    end_datetime: datetime.datetime,
+    attendees: list = None
+):
+    """Async variant of `create_calendar_event` that does not block the event loop."""
     try:
-        response = service.freebusy().query(body=body).execute()
-        calendars_data = response.get('calendars', {})
-        if calendar_id in calendars_data:
-            return calendars_data[calendar_id].get('busy', [])
-        return []
-    except HttpError as error:
-        logger.error(f"An error occurred checking Google Calendar free/busy: {error}")
-        return []
+        token = await _get_access_token()
+        if not token:
+            logger.warning("Google Calendar credentials not available to create event.")
+            return None
+
+        response = await _post_with_retry(
+            f"/calendars/{quote(calendar_id, safe='')}/events",
+            token,
+            params={"conferenceDataVersion": 1, "sendUpdates": "none"},
+            json=_build_event_body(summary, description, start_datetime, end_datetime),
+        )
+        response.raise_for_status()
+        event = response.json()
+        logger.info("Event created: %s", event.get('htmlLink'))
+        await _ainvalidate_cached_busy(calendar_id, start_datetime, end_datetime)
+        return event.get('id')
+    except (httpx.HTTPError, GoogleAuthError) as error:
+        logger.error("An error occurred creating Google Calendar event: %s", error)
+        return None
+
+
+async def get_free_busy_slots_async(calendar_id: str, start_time: datetime.datetime, end_time: datetime.datetime):
+    """
+    Async variant of `get_free_busy_slots` that does not block the event loop.
+    Returns None (never an empty list) when the lookup failed, so callers can tell "free" from "unknown".
+    """
+    busy = await _aget_cached_busy(calendar_id, start_time, end_time)
+    if busy is not None:
+        return busy
+
+    try:
+        token = await _get_access_token()
+        if not token:
+            logger.warning("Google Calendar credentials not available to check free/busy slots.")
+            return None
+
+        response = await _post_with_retry(
+            "/freeBusy",
+            token,
+            json=_build_free_busy_body([calendar_id], start_time, end_time),
+        )
+        response.raise_for_status()
+        calendar_data = response.json().get('calendars', {}).get(calendar_id, {})
+        if calendar_data.get('errors'): # e.g. notFound / no access for this calendar
+            logger.error("Google Calendar free/busy returned errors for %s: %s", calendar_id, calendar_data['errors'])
+            return None
+        busy = calendar_data.get('busy', [])
+        await _aset_cached_busy(calendar_id, start_time, end_time, busy)
+        return busy
+    except (httpx.HTTPError, GoogleAuthError) as error:
+        logger.error("An error occurred checking Google Calendar free/busy: %s", error)
+        return None
+
+
+async def get_free_busy_many(calendar_ids: list, start_time: datetime.datetime, end_time: datetime.datetime) -> dict:
+    """
+    Gets free/busy information for several calendars with concurrent per-calendar requests.
+    Use when a single batched freebusy query is not possible (e.g. calendars need different credentials).
+    Returns a dict mapping each calendar ID to its busy list; calendars whose lookup failed are left out.
+    """
+    results = await asyncio.gather(
+        *(get_free_busy_slots_async(cid, start_time, end_time) for cid in calendar_ids),
+        return_exceptions=True
+    )
+    busy_by_calendar = {}
+    for cid, result in zip(calendar_ids, results):
+        if isinstance(result, Exception):
+            logger.error("An error occurred checking Google Calendar free/busy for %s: %s", cid, result)
+            continue
+        if result is not None:
+            busy_by_calendar[cid] = result
+    return busy_by_calendar
+
+
+async def acreate_calendar_events_batch(service, requests: list):
+    """Runs `create_calendar_events_batch` on the Calendar thread pool so async callers never block the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(
+        _GCAL_EXECUTOR, functools.partial(create_calendar_events_batch, service, requests)
+    )
+
+
+async def aget_free_busy_slots_for_calendars(service, calendar_ids: list, start_time: datetime.datetime, end_time: datetime.datetime) -> dict:
+    """Runs `get_free_busy_slots_for_calendars` on the Calendar thread pool so async callers never block the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(
+        _GCAL_EXECUTOR, functools.partial(get_free_busy_slots_for_calendars, service, calendar_ids, start_time, end_time)
+    )
+
+
+async def close_async_client():
+    """Closes the shared async HTTP and Redis clients. Called on application shutdown."""
+    global _async_client, _aredis_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+    if _aredis_client is not None:
+        await _aredis_client.aclose()
+        _aredis_client = None
+
 
 if __name__ == '__main__':
     # This block is for local testing with Service Account, not browser flow
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
     logger.info("Running calendar_service.py for local Service Account testing...")
     service = get_calendar_service()
     if service:
@@ -166,12 +678,12 @@ if __name__ == '__main__':
         #     attendees=[{'email': test_doctor_calendar_id}]
         # )
         # if event_id:
-        #     logger.info(f"Test event created with ID: {event_id}")
+        #     logger.info("Test event created with ID: %s", event_id)
         # else:
         #     logger.warning("Failed to create test event locally.")
 
         # busy_slots = get_free_busy_slots(service, test_doctor_calendar_id, start_event_time, end_event_time)
-        # logger.info(f"Test busy slots for {test_doctor_calendar_id}: {busy_slots}")
+        # logger.info("Test busy slots for %s: %s", test_doctor_calendar_id, busy_slots)
 
     else:
         logger.warning("Service account test: Failed to acquire calendar service.")
\ No newline at end of file
@@ -1,7 +1,17 @@
 # backend/create_db_tables.py
+# Usage: python create_db_tables.py [--fresh]
+#   --fresh  Skip per-table existence checks; use only on an empty database.
+import sys
+
 from database import Base, engine
-from models import Doctor, Patient, Appointment # Import your models to ensure they are registered with Base
+from models import Doctor, Patient, Appointment, create_missing_indexes # Import your models to ensure they are registered with Base
+
+fresh = "--fresh" in sys.argv[1:]
 
 print("Creating database tables...")
-Base.metadata.create_all(bind=engine)
-print("Database tables created successfully!")
\ No newline at end of file
+# One transaction so all CREATE TABLE statements commit together
+with engine.begin() as conn:
+    Base.metadata.create_all(bind=conn, checkfirst=not fresh)
+    if not fresh:
+        create_missing_indexes(conn) # Existing tables don't get new indexes from create_all
+print("Database tables created successfully!")
@@ -11,9 +11,19 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable not set. Please check your .env file.")
 
-engine = create_engine(DATABASE_URL)
+# Connection pool sized for concurrent FastAPI workers; override via env per deployment.
+# For production, DATABASE_URL can point at PgBouncer (transaction pooling) in front of Postgres.
+engine = create_engine(
+    DATABASE_URL,
+    pool_size=int(os.getenv("DB_POOL_SIZE", "20")),
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+    pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", "30")),
+    pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "3600")), # Drop connections before server/proxy idle limits
+    pool_pre_ping=True # Transparently replace connections that went stale
+)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False: committed objects keep their loaded state, so endpoints can return them without a refresh SELECT
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 
 Base = declarative_base()
 
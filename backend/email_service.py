@@ -2,36 +2,116 @@
 import yagmail
 import os
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 
 EMAIL_USERNAME = os.getenv("EMAIL_USERNAME")
 EMAIL_APP_PASSWORD = os.getenv("EMAIL_APP_PASSWORD")
+_EMAIL_ENABLED = bool(EMAIL_USERNAME and EMAIL_APP_PASSWORD)
+
+# Sends run here so request handlers don't wait on the SMTP handshake and delivery. One worker:
+# every send holds _yag_lock on the single shared SMTP connection, so more threads would only queue on it.
+_EMAIL_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="email")
+
+# One authenticated SMTP connection is reused across emails; reconnect after it sits idle
+SMTP_IDLE_TIMEOUT_SECONDS = 120
+_yag = None
+_yag_lock = threading.Lock()
+_yag_last_used = 0.0
+
+def _close_smtp_connection():
+    """Closes the shared SMTP connection, if any. Caller must hold _yag_lock."""
+    global _yag
+    if _yag is not None:
+        try:
+            _yag.close()
+        except Exception as e:
+            logger.warning("Error closing SMTP connection: %s", e)
+        _yag = None
+
+def _get_smtp_connection():
+    """Returns the shared SMTP connection, reconnecting if it has been idle too long. Caller must hold _yag_lock."""
+    global _yag
+    if _yag is not None and time.monotonic() - _yag_last_used > SMTP_IDLE_TIMEOUT_SECONDS:
+        _close_smtp_connection()
+    if _yag is None:
+        _yag = yagmail.SMTP({EMAIL_USERNAME: "Smart Doctor Assistant"}, EMAIL_APP_PASSWORD)
+    return _yag
+
+def _send_with_retry(recipient_email: str, subject: str, body: str) -> bool:
+    """Sends one email over the shared SMTP connection, reconnecting once on failure. Caller must hold _yag_lock."""
+    global _yag_last_used
+    for attempt in range(2):
+        try:
+            yag = _get_smtp_connection()
+            # yagmail returns False when it gave up on a dropped connection (it doesn't raise),
+            # otherwise sendmail's dict of refused recipients
+            result = yag.send(
+                to=recipient_email,
+                subject=subject,
+                contents=body
+            )
+        except OSError as e: # smtplib.SMTPException and socket errors
+            error = e
+        except Exception as e:
+            _close_smtp_connection()
+            logger.error("Failed to send email to %s: %s", recipient_email, e)
+            return False
+        else:
+            if result is not False:
+                _yag_last_used = time.monotonic()
+                if result:
+                    logger.error("SMTP server refused email to %s: %s", recipient_email, result)
+                    return False
+                logger.info("Confirmation email sent to %s", recipient_email)
+                return True
+            error = "connection lost"
+        # The server may have dropped the pooled connection; reconnect and retry once
+        _close_smtp_connection()
+        if attempt == 0:
+            logger.warning("SMTP error sending email to %s, reconnecting: %s", recipient_email, error)
+            continue
+        logger.error("Failed to send email to %s: %s", recipient_email, error)
+        return False
+
+def send_confirmation_emails(messages: list) -> list:
+    """
+    Sends several (recipient_email, subject, body) emails over one authenticated SMTP session.
+    Returns a success flag per message, in order.
+    """
+    if not _EMAIL_ENABLED:
+        logger.warning("Email credentials not set. Cannot send email.")
+        return [False] * len(messages)
+
+    with _yag_lock:
+        return [_send_with_retry(recipient_email, subject, body) for recipient_email, subject, body in messages]
 
 def send_confirmation_email(recipient_email: str, subject: str, body: str):
     """Sends an email using Yagmail."""
-    if not EMAIL_USERNAME or not EMAIL_APP_PASSWORD:
-        logger.warning("Email credentials not set. Cannot send email.")
-        return False
+    return send_confirmation_emails([(recipient_email, subject, body)])[0]
 
-    try:
-        yag = yagmail.SMTP({EMAIL_USERNAME: "Smart Doctor Assistant"}, EMAIL_APP_PASSWORD)
-        yag.send(
-            to=recipient_email,
-            subject=subject,
-            contents=body
-        )
-        logger.info(f"Confirmation email sent to {recipient_email}")
-        return True
-    except Exception as e:
-        logger.error(f"Failed to send email to {recipient_email}: {e}")
-        return False
+def send_confirmation_email_background(recipient_email: str, subject: str, body: str):
+    """Queues a confirmation email on the email worker pool and returns immediately."""
+    return _EMAIL_EXECUTOR.submit(send_confirmation_email, recipient_email, subject, body)
+
+def send_confirmation_emails_background(messages: list):
+    """Queues several emails to be sent over one SMTP session on the email worker pool and returns immediately."""
+    return _EMAIL_EXECUTOR.submit(send_confirmation_emails, messages)
+
+def shutdown_email_worker():
+    """Waits for queued emails to be sent and closes the SMTP connection. Called on application shutdown."""
+    _EMAIL_EXECUTOR.shutdown(wait=True)
+    with _yag_lock:
+        _close_smtp_connection()
 
 if __name__ == "__main__":
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
     # Ensure EMAIL_USERNAME and EMAIL_APP_PASSWORD are set in your .env for independent testing
     test_recipient = "test@example.com" # Replace with a real email for testing
     test_subject = "Test Subject from Smart Doctor Assistant"
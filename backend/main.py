@@ -4,36 +4,61 @@ import os
 from datetime import datetime, timedelta
 import logging
 from contextlib import asynccontextmanager
+from functools import cache, lru_cache
 
 # Third-party library imports
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import BackgroundTasks, FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from pydantic import BaseModel, Field, EmailStr # BaseModel used for local ChatRequest/Response if not imported from schemas
-from sqlalchemy.orm import Session
+from pydantic import BaseModel, Field, EmailStr, TypeAdapter # BaseModel used for local ChatRequest/Response if not imported from schemas
+from sqlalchemy import and_, exists, func, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload, selectinload
 from dotenv import load_dotenv
 from typing import List, Dict, Union, Optional
+import httpx
+import orjson
 from langchain_openai import ChatOpenAI
 from langchain.agents import AgentExecutor, create_openai_tools_agent
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import AIMessage, HumanMessage
 from langchain.tools import StructuredTool
 
+try:
+    import redis.asyncio as aioredis # Optional: hot chat history cache when REDIS_URL is set
+except ImportError:
+    aioredis = None
+
+load_dotenv()
+
+# Configure logging once for the whole app, before local modules start logging at import time
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+
 # Local application imports
 import models, schemas
 from auth import (
-    get_password_hash, verify_password, create_access_token,
+    get_password_hash, verify_password, dummy_verify_password, create_access_token,
     get_current_active_user, require_role
 )
-from database import engine, get_db
+from database import engine, get_db, SessionLocal
+from calendar_service import close_async_client
+from email_service import shutdown_email_worker
 from tools import (
+    ALL_SLOTS,
+    cache_doctor,
+    load_doctor_index,
     check_doctor_availability_tool,
+    check_any_doctor_availability_tool,
     book_appointment_tool,
     get_doctor_summary_report_tool,
     list_all_doctors_tool
 )
 from schemas import ( # Import all necessary Pydantic schemas
     CheckDoctorAvailabilityInput,
+    CheckAnyDoctorAvailabilityInput,
     BookAppointmentInput,
     DoctorRegister,
     GetDoctorSummaryReportInput,
@@ -44,13 +69,19 @@ from schemas import ( # Import all necessary Pydantic schemas
     ConversationHistory # Ensure ConversationHistory is imported
 )
 
-# Setup logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-load_dotenv()
-
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+MAX_HISTORY_TURNS = int(os.getenv("MAX_HISTORY_TURNS", "8")) # Human/AI turns of prior history sent to the agent; bounds prefill per turn
+REDIS_URL = os.getenv("REDIS_URL")
+CHAT_CACHE_TTL_SECONDS = 24 * 60 * 60
+# List adapters for the row-heavy endpoints: validate the ORM rows and dump JSON in one pass through
+# pydantic-core, instead of per-item model construction plus FastAPI's response_model re-validation
+DoctorList = TypeAdapter(List[schemas.Doctor])
+PatientList = TypeAdapter(List[schemas.Patient])
+ConversationHistoryList = TypeAdapter(List[schemas.ConversationHistory])
+
+chat_cache = None # redis.asyncio client, created on startup when REDIS_URL is set
 
 
 @asynccontextmanager
@@ -62,18 +93,37 @@ async def lifespan(app: FastAPI):
     logger.info("Application startup: Attempting to create database tables...")
     try:
         models.Base.metadata.create_all(bind=engine)
+        models.create_missing_indexes(engine)
         logger.info("Database tables created/checked successfully on startup.")
     except Exception as e:
         logger.error(f"Error creating database tables on startup: {e}")
 
+    try:
+        with SessionLocal() as db:
+            load_doctor_index(db)
+    except Exception as e:
+        logger.error("Error loading doctor index on startup: %s", e) # Tools fall back to DB lookups
+
+    global chat_cache
+    if REDIS_URL:
+        if aioredis is None:
+            logger.warning("REDIS_URL is set but the 'redis' package is not installed. Chat history will be read from Postgres.")
+        else:
+            chat_cache = aioredis.Redis.from_url(REDIS_URL)
+
     # Yield control to the application to start serving requests
     yield
 
     # This part runs on shutdown (optional for this assignment, but good to know)
     logger.info("Application shutdown: Performing cleanup (if any)...")
+    await close_async_client()
+    await openai_http_client.aclose()
+    shutdown_email_worker()
+    if chat_cache is not None:
+        await chat_cache.aclose()
 
 
-app = FastAPI(lifespan=lifespan) 
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse) # orjson serialises response bodies much faster than json.dumps
 
 # Configure CORS middleware
 origins = [
@@ -92,6 +142,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def _json_list_response(adapter: TypeAdapter, rows) -> Response:
+    """Serialises rows with a list TypeAdapter; returning a Response skips FastAPI's second validation pass."""
+    return Response(content=adapter.dump_json(adapter.validate_python(rows, from_attributes=True)), media_type="application/json")
+
 @app.get("/")
 def read_root():
     """Returns a welcome message for the API root."""
@@ -105,37 +159,35 @@ def register_user(
     db: Session = Depends(get_db)
 ):
     """Registers a new user (patient or doctor) and creates/links a profile."""
-    # Check if email is already registered
-    db_user = db.query(models.User).filter(models.User.email == user_data.email).first()
-    if db_user:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
+    if user_data.role == "doctor" and not isinstance(user_data, schemas.DoctorRegister):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Doctor registration requires name and specialty.")
 
-    # Hash password and create User entry
+    # User and profile are written in one transaction: a single commit, and no orphaned user if the profile fails
     hashed_password = get_password_hash(user_data.password)
     db_user = models.User(email=user_data.email, hashed_password=hashed_password, role=user_data.role)
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    if user_data.role == "patient":
-        db_patient = db.query(models.Patient).filter(models.Patient.email == user_data.email).first()
-        if not db_patient:
-            db_patient = models.Patient(name=user_data.email.split('@')[0], email=user_data.email, user_id=db_user.id)
-            db.add(db_patient)
-            db.commit()
-            db.refresh(db_patient)
-        else:
-            db_patient.user_id = db_user.id
-            db.commit()
-            db.refresh(db_patient) 
-
-    elif user_data.role == "doctor":
-        if not isinstance(user_data, schemas.DoctorRegister):
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Doctor registration requires name and specialty.")
+    db_doctor = None
+    try:
+        db.add(db_user)
+        db.flush() # Assigns db_user.id; the unique email index rejects duplicates here, no pre-check SELECT needed
+
+        if user_data.role == "patient":
+            # Create the patient profile, or link an existing one (e.g. created during an earlier booking)
+            db.execute(
+                pg_insert(models.Patient).values(
+                    name=user_data.email.split('@')[0], email=user_data.email, user_id=db_user.id
+                ).on_conflict_do_update(index_elements=[models.Patient.email], set_={"user_id": db_user.id})
+            )
+        elif user_data.role == "doctor":
+            db_doctor = models.Doctor(user_id=db_user.id,name=user_data.name, specialty=user_data.specialty, email=user_data.email)
+            db.add(db_doctor)
 
-        db_doctor = models.Doctor(user_id=db_user.id,name=user_data.name, specialty=user_data.specialty, email=user_data.email)
-        db.add(db_doctor)
         db.commit()
-        db.refresh(db_doctor)
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
+
+    if db_doctor is not None:
+        cache_doctor(db_doctor)
 
     return db_user
 
@@ -143,6 +195,8 @@ def register_user(
 def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     """Handles user login and issues a JWT access token."""
     user = db.query(models.User).filter(models.User.email == form_data.username).first()
+    if not user:
+        dummy_verify_password()
     if not user or not verify_password(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -161,84 +215,273 @@ def read_users_me(current_user: models.User = Depends(get_current_active_user)):
     return current_user
 
 # --- LLM Agent Setup ---
-llm = ChatOpenAI(model="gpt-4o", temperature=0, api_key=os.getenv("OPENAI_API_KEY"))
-
-check_availability_tool = StructuredTool.from_function(
-    func=check_doctor_availability_tool,
-    name="check_doctor_availability",
-    description="Useful for finding out available time slots for a doctor on a specific date. Input must include doctor's name and date in YYYY-MM-DD.",
-    args_schema=CheckDoctorAvailabilityInput,
-    handle_tool_error=True,
-    coroutine=check_doctor_availability_tool
+# One pooled client for all OpenAI calls so chat turns reuse warm TLS connections; closed on shutdown
+openai_http_client = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    timeout=30
 )
 
-book_appointment_langchain_tool = StructuredTool.from_function(
-    func=book_appointment_tool,
-    name="book_appointment",
-    description="Useful for booking a new appointment for a patient with a doctor. Input must include doctor's name, patient's name, patient's email, date in YYYY-MM-DD, and time slot in HH:MM. Ensure the time slot is available before booking.",
-    args_schema=BookAppointmentInput,
-    handle_tool_error=True,
-    coroutine=book_appointment_tool
-)
-list_doctors_tool = StructuredTool.from_function(
-    func=list_all_doctors_tool,
-    name="list_all_doctors",
-    description="Useful for providing a list of all doctors available in the system, along with their specialties. Use this when the user asks to see available doctors or to list all doctors.",
-    # This tool takes no specific arguments, so args_schema can be simple/empty
-    # args_schema=BaseModel, # Or just omit if the function takes no arguments and description is clear
-    handle_tool_error=True,
-    coroutine=list_all_doctors_tool
-)
 
-get_summary_report_tool = StructuredTool.from_function(
-    func=get_doctor_summary_report_tool,
-    name="get_doctor_summary_report",
-    description="Useful for retrieving various summary reports for a doctor, such as daily appointments or total patients visited. Input must include doctor's name and report type. Optional date/date range can be provided for specific reports. Requires 'doctor' role.",
-    args_schema=GetDoctorSummaryReportInput,
-    handle_tool_error=True,
-    coroutine=get_doctor_summary_report_tool
-)
+@cache
+def get_llm() -> ChatOpenAI:
+    """Chat model, built on first use so importing this module stays cheap."""
+    return ChatOpenAI(
+        model="gpt-4o", temperature=0, api_key=os.getenv("OPENAI_API_KEY"), http_async_client=openai_http_client
+    )
 
-tools = [
-    check_availability_tool,
-    book_appointment_langchain_tool,
-    get_summary_report_tool,
-    list_doctors_tool
-]
-prompt = ChatPromptTemplate.from_messages(
-    [
-        ("system", f"""You are a helpful AI assistant for managing doctor appointments and generating reports.
-        You have access to the following specialized tools to assist users:
-        - `list_all_doctors`: Use this to show the user a list of all doctors and their specialties in the system. (Accessible by all users)
-        - `check_doctor_availability`: Use this to find out available time slots for any doctor. (Accessible by all users)
-        - `book_appointment`: Use this to schedule a new appointment. (Accessible by all users)
-        - `get_doctor_summary_report`: Use this to retrieve statistical reports about a doctor's appointments. **Important: This tool is strictly for users with the 'doctor' role only.**
-
-        **Current User's Role: {{current_user_role}}**
-
-        Here are your strict instructions for interacting with users:
-        1. Always be polite, professional, and empathetic.
-        2. If the user asks "Who are the doctors?", "List all doctors", or similar queries to see available doctors, you MUST use the `list_all_doctors` tool and present the list clearly. After presenting the list, ask the user to choose a doctor for an appointment.
-        3. When a user asks to book an appointment, you MUST first use the `check_doctor_availability` tool for the requested date and time.
-        4. For booking an appointment, always ask for the patient's full name and their email address for confirmation.
-        5. **Regarding reports: If a user asks for a doctor summary report, you MUST first check the 'role' in the `user_info` variable. If `user_info['role']` is NOT 'doctor', you must immediately inform the user that they do not have permission to view reports and DO NOT proceed with calling the `get_doctor_summary_report` tool. For any other role (e.g., 'doctor'), you should proceed with calling the tool.**
-        6. Provide clear confirmations for successful actions (like booking).
-        7. If any tool returns an error (e.g., doctor not found, slot unavailable, access denied from backend), explain the error clearly to the user and suggest appropriate next steps or alternatives.
-        Today's date is {datetime.now().strftime("%Y-%m-%d")}."""
-        ),
-        MessagesPlaceholder(variable_name="chat_history"),
-        ("human", "{input}"),
-        MessagesPlaceholder(variable_name="agent_scratchpad"),
+
+# Terse descriptions sent once a conversation is underway. Chat Completions calls are stateless, so
+# from turn 2 on the model only ever sees these (plus the system prompt's per-tool guidance), never the
+# full text; constraints the model must follow stay in them. Trade-off: fewer prompt tokens on every
+# follow-up turn, but turn 1 and later turns have different tool text, so they don't share a cached
+# prompt prefix with each other (follow-up turns still share one among themselves).
+# Argument schemas are left intact since they carry the date/time format hints.
+COMPACT_TOOL_DESCRIPTIONS = {
+    "check_doctor_availability": "Available slots for a doctor on a date (YYYY-MM-DD).",
+    "check_any_doctor_availability": "Available slots for every doctor on a date (YYYY-MM-DD).",
+    "book_appointment": "Book an appointment in an available slot. Check availability before booking.",
+    "get_doctor_summary_report": "Doctor summary reports. 'doctor' role only.",
+    "list_all_doctors": "List all doctors and specialties.",
+}
+
+
+@cache
+def get_tools(compact: bool = False) -> List[StructuredTool]:
+    """
+    Agent tools, built on the first chat request rather than at import (each one compiles its
+    args schema). compact=True returns copies with the short descriptions above.
+    """
+    if compact:
+        return [tool.model_copy(update={"description": COMPACT_TOOL_DESCRIPTIONS[tool.name]}) for tool in get_tools()]
+
+    check_availability_tool = StructuredTool.from_function(
+        name="check_doctor_availability",
+        description="Useful for finding out available time slots for a doctor on a specific date. Input must include doctor's name and date in YYYY-MM-DD.",
+        args_schema=CheckDoctorAvailabilityInput,
+        handle_tool_error=True,
+        coroutine=check_doctor_availability_tool
+    )
+
+    check_any_availability_tool = StructuredTool.from_function(
+        name="check_any_doctor_availability",
+        description="Useful for finding out which doctors are free on a specific date and their available time slots. Input must include the date in YYYY-MM-DD. Use this instead of checking doctors one by one.",
+        args_schema=CheckAnyDoctorAvailabilityInput,
+        handle_tool_error=True,
+        coroutine=check_any_doctor_availability_tool
+    )
+
+    book_appointment_langchain_tool = StructuredTool.from_function(
+        name="book_appointment",
+        description="Useful for booking a new appointment for a patient with a doctor. Input must include doctor's name, patient's name, patient's email, date in YYYY-MM-DD, and time slot in HH:MM. Ensure the time slot is available before booking.",
+        args_schema=BookAppointmentInput,
+        handle_tool_error=True,
+        coroutine=book_appointment_tool
+    )
+    list_doctors_tool = StructuredTool.from_function(
+        name="list_all_doctors",
+        description="Useful for providing a list of all doctors available in the system, along with their specialties. Use this when the user asks to see available doctors or to list all doctors.",
+        # This tool takes no specific arguments, so args_schema can be simple/empty
+        # args_schema=BaseModel, # Or just omit if the function takes no arguments and description is clear
+        handle_tool_error=True,
+        coroutine=list_all_doctors_tool
+    )
+
+    get_summary_report_tool = StructuredTool.from_function(
+        name="get_doctor_summary_report",
+        description="Useful for retrieving various summary reports for a doctor, such as daily appointments or total patients visited. Input must include doctor's name and report type. Optional date/date range can be provided for specific reports. Requires 'doctor' role.",
+        args_schema=GetDoctorSummaryReportInput,
+        handle_tool_error=True,
+        coroutine=get_doctor_summary_report_tool
+    )
+
+    return [
+        check_availability_tool,
+        check_any_availability_tool,
+        book_appointment_langchain_tool,
+        get_summary_report_tool,
+        list_doctors_tool
     ]
-)
 
-agent = create_openai_tools_agent(llm, tools, prompt)
-agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
+# Static instructions: kept free of per-request values so the prompt prefix (tools + this block)
+# is byte-identical across requests and the provider's automatic prefix caching can reuse it.
+SYSTEM_PROMPT = """You are a helpful AI assistant for managing doctor appointments and generating reports.
+You have access to the following specialized tools to assist users:
+- `list_all_doctors`: Use this to show the user a list of all doctors and their specialties in the system. (Accessible by all users)
+- `check_doctor_availability`: Use this to find out available time slots for any doctor. (Accessible by all users)
+- `check_any_doctor_availability`: Use this when the user asks which doctors are free on a date, e.g. "who's available today?". (Accessible by all users)
+- `book_appointment`: Use this to schedule a new appointment. (Accessible by all users)
+- `get_doctor_summary_report`: Use this to retrieve statistical reports about a doctor's appointments. **Important: This tool is strictly for users with the 'doctor' role only.**
+
+Here are your strict instructions for interacting with users:
+1. Always be polite, professional, and empathetic.
+2. If the user asks "Who are the doctors?", "List all doctors", or similar queries to see available doctors, you MUST use the `list_all_doctors` tool and present the list clearly. After presenting the list, ask the user to choose a doctor for an appointment.
+3. When a user asks to book an appointment, you MUST first use the `check_doctor_availability` tool for the requested date and time.
+4. For booking an appointment, always ask for the patient's full name and their email address for confirmation.
+5. **Regarding reports: If a user asks for a doctor summary report, you MUST first check the 'role' in the `user_info` variable. If `user_info['role']` is NOT 'doctor', you must immediately inform the user that they do not have permission to view reports and DO NOT proceed with calling the `get_doctor_summary_report` tool. For any other role (e.g., 'doctor'), you should proceed with calling the tool.**
+6. Provide clear confirmations for successful actions (like booking).
+7. If any tool returns an error (e.g., doctor not found, slot unavailable, access denied from backend), explain the error clearly to the user and suggest appropriate next steps or alternatives.
+8. When a user asks about multiple doctors or multiple dates, issue the independent tool calls in parallel in a single turn."""
+
+# Per-request context, sent as a separate message after the cacheable prefix
+REQUEST_CONTEXT_PROMPT = """**Current User's Role: {current_user_role}**
+Today's date is {today}."""
+
+
+@lru_cache(maxsize=4)
+def _build_executor(date_str: str, compact: bool = False) -> AgentExecutor:
+    """
+    Builds the agent executor for a given day. Cached so the prompt/agent construction runs
+    at most once per day and tool set; the user's role is still supplied as a prompt variable at invoke time.
+    compact=True uses the short tool descriptions for follow-up turns.
+    """
+    turn_tools = get_tools(compact)
+    prompt = ChatPromptTemplate.from_messages(
+        [
+            ("system", SYSTEM_PROMPT),
+            ("system", REQUEST_CONTEXT_PROMPT),
+            MessagesPlaceholder(variable_name="chat_history"),
+            ("human", "{input}"),
+            MessagesPlaceholder(variable_name="agent_scratchpad"),
+        ]
+    ).partial(today=date_str)
+    agent = create_openai_tools_agent(get_llm(), turn_tools, prompt)
+    return AgentExecutor(agent=agent, tools=turn_tools, verbose=True)
+
+
+def _persist_turn(user_id: int, user_message: str, ai_message: Optional[str]) -> List[int]:
+    """
+    Saves one chat turn to ConversationHistory in its own session (runs after the response is sent).
+    Returns the new row ids, or an empty list if the write failed.
+    """
+    entries = [models.ConversationHistory(user_id=user_id, role="human", content=user_message)]
+    if ai_message is not None:
+        entries.append(models.ConversationHistory(user_id=user_id, role="ai", content=ai_message))
+    db = SessionLocal()
+    try:
+        db.add_all(entries)
+        db.flush()
+        entry_ids = [entry.id for entry in entries]
+        db.commit()
+        return entry_ids
+    except Exception as e:
+        db.rollback()
+        logger.error("Error saving conversation history for user %s: %s", user_id, e)
+        return []
+    finally:
+        db.close()
+
+
+def _chat_cache_key(user_id: int) -> str:
+    return f"chat:{user_id}"
+
+
+async def _get_cached_history(user_id: int) -> Optional[List[Dict]]:
+    """Returns the user's recent messages from Redis, or None on a miss (or if Redis is unavailable)."""
+    if chat_cache is None:
+        return None
+    try:
+        raw_messages = await chat_cache.lrange(_chat_cache_key(user_id), -MAX_HISTORY_TURNS * 2, -1)
+    except aioredis.RedisError as e:
+        logger.warning("Chat history cache read failed for user %s: %s", user_id, e)
+        return None
+    if not raw_messages:
+        return None
+    return [orjson.loads(raw) for raw in raw_messages]
+
+
+async def _cache_turn(user_id: int, new_messages: List[Dict], seed_history: Optional[List[Dict]] = None):
+    """
+    Appends a turn to the user's cached history. On a cold cache, seed_history (loaded from Postgres)
+    is written first so the cached list never holds a partial view of the conversation.
+    """
+    if chat_cache is None:
+        return
+    key = _chat_cache_key(user_id)
+    try:
+        async with chat_cache.pipeline(transaction=True) as pipe:
+            if seed_history is not None:
+                pipe.delete(key)
+                pipe.rpush(key, *[orjson.dumps(msg) for msg in seed_history + new_messages])
+            else:
+                pipe.rpushx(key, *[orjson.dumps(msg) for msg in new_messages]) # No-op if the key expired meanwhile
+            pipe.ltrim(key, -MAX_HISTORY_TURNS * 2, -1)
+            pipe.expire(key, CHAT_CACHE_TTL_SECONDS)
+            await pipe.execute()
+    except aioredis.RedisError as e:
+        logger.warning("Chat history cache write failed for user %s: %s", user_id, e)
+
+
+async def _invalidate_cached_history(user_id: int):
+    if chat_cache is None:
+        return
+    try:
+        await chat_cache.delete(_chat_cache_key(user_id))
+    except aioredis.RedisError as e:
+        logger.warning("Chat history cache invalidation failed for user %s: %s", user_id, e)
+
+def _query_recent_history(user_id: int, db: Session) -> List[Dict]:
+    recent_rows = db.query(
+        models.ConversationHistory.id, models.ConversationHistory.role, models.ConversationHistory.content
+    ).filter(
+        models.ConversationHistory.user_id == user_id
+    ).order_by(
+        models.ConversationHistory.timestamp.desc(), models.ConversationHistory.id.desc()
+    ).limit(MAX_HISTORY_TURNS * 2).all()[::-1]
+    return [{"id": row.id, "role": row.role, "content": row.content} for row in recent_rows]
+
+
+async def _load_recent_history(user_id: int, db: Session):
+    """
+    Returns (recent_history, cache_hit) with the last MAX_HISTORY_TURNS turns as role/content dicts.
+    Redis holds the hot window; Postgres is the fallback for cold sessions and the source of truth.
+    """
+    recent_history = await _get_cached_history(user_id)
+    if recent_history is not None:
+        return recent_history, True
+    # Sync Session: run the query in the threadpool so it doesn't block the event loop
+    return await run_in_threadpool(_query_recent_history, user_id, db), False
+
+
+def _history_cursor(recent_history: List[Dict]) -> Optional[int]:
+    """Id of the newest saved message the server answered from; /history/?since=<cursor> returns everything after it."""
+    return max((msg["id"] for msg in recent_history if "id" in msg), default=None)
+
+
+def _build_agent_input(user_message: str, current_user: models.User, recent_history: List[Dict]) -> Dict:
+    formatted_chat_history = [
+        HumanMessage(content=msg["content"]) if msg["role"] == "human" else AIMessage(content=msg["content"])
+        for msg in recent_history
+    ]
+    return {
+        "input": user_message,
+        "chat_history": formatted_chat_history,
+        "current_user_role": current_user.role,   # <--- NEW: Pass role directly for prompt
+        "current_user_email": current_user.email, # <--- NEW: Pass email directly for prompt
+        "user_info": {"id": current_user.id, "email": current_user.email, "role": current_user.role} # Still pass for tool argument if needed internally by tools
+    }
+
+
+async def _save_turn(user_id: int, new_messages: List[Dict], seed_history: Optional[List[Dict]]):
+    """Writes the turn to Postgres, then appends it (with its row ids) to the Redis window."""
+    entry_ids = await run_in_threadpool(_persist_turn, user_id, new_messages[0]["content"], new_messages[1]["content"])
+    if not entry_ids:
+        await _invalidate_cached_history(user_id)
+        return
+    await _cache_turn(user_id, [{"id": entry_id, **msg} for entry_id, msg in zip(entry_ids, new_messages)], seed_history)
+
+
+def _schedule_turn_persistence(
+    background_tasks: BackgroundTasks, user_id: int, new_messages: List[Dict],
+    recent_history: List[Dict], cache_hit: bool
+):
+    """Saves both sides of the turn after the response is sent, off the request's critical path."""
+    background_tasks.add_task(_save_turn, user_id, new_messages, None if cache_hit else recent_history)
 
 # --- FastAPI Endpoint for LLM Chat ---
 @app.post("/chat/", response_model=schemas.ChatResponse)
 async def chat_with_assistant(
     request: schemas.ChatRequest,
+    background_tasks: BackgroundTasks,
     current_user: models.User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
@@ -246,70 +489,143 @@ async def chat_with_assistant(
     Interacts with the AI assistant. Handles natural language input, tool invocation,
     conversation continuity, and saves chat history. Requires authentication.
     """
-    # Save human message to DB
-    user_message_entry = models.ConversationHistory(
-        user_id=current_user.id,
-        role="human",
-        content=request.user_message
-    )
-    db.add(user_message_entry)
-    db.commit()
-    db.refresh(user_message_entry)
-
-    formatted_chat_history = []
-    # Use chat_history from request directly for LLM context
-    for msg in request.chat_history:
-        if msg["role"] == "human":
-            formatted_chat_history.append(HumanMessage(content=msg["content"]))
-        elif msg["role"] == "ai":
-            formatted_chat_history.append(AIMessage(content=msg["content"]))
+    # Only the most recent turns are sent, so prompt size stays bounded over long sessions
+    recent_history, cache_hit = await _load_recent_history(current_user.id, db)
 
     try:
-        agent_input_data = {
-            "input": request.user_message,
-            "chat_history": formatted_chat_history,
-            "current_user_role": current_user.role,   # <--- NEW: Pass role directly for prompt
-            "current_user_email": current_user.email, # <--- NEW: Pass email directly for prompt
-            "user_info": {"id": current_user.id, "email": current_user.email, "role": current_user.role} # Still pass for tool argument if needed internally by tools
-        }
-
-        result = await agent_executor.ainvoke(agent_input_data)
-        ai_response_content = result.get("output", "I could not process that request.")
+        agent_input_data = _build_agent_input(request.user_message, current_user, recent_history)
 
-        # Save AI's response to DB
-        ai_message_entry = models.ConversationHistory(
-            user_id=current_user.id,
-            role="ai",
-            content=ai_response_content
-        )
-        db.add(ai_message_entry)
-        db.commit()
-        db.refresh(ai_message_entry)
+        executor = _build_executor(datetime.now().strftime("%Y-%m-%d"), compact=bool(recent_history))
+        result = await executor.ainvoke(agent_input_data)
+        ai_response_content = result.get("output", "I could not process that request.")
 
-        # Return updated history including new messages
-        updated_history = request.chat_history + [
+        new_messages = [
             {"role": "human", "content": request.user_message},
             {"role": "ai", "content": ai_response_content}
         ]
+        _schedule_turn_persistence(background_tasks, current_user.id, new_messages, recent_history, cache_hit)
 
-        return schemas.ChatResponse(ai_response=ai_response_content, updated_chat_history=updated_history)
+        # Only the new turn goes back; the client appends it locally and can resync via /history/?since=cursor
+        return schemas.ChatResponse(
+            ai_response=ai_response_content,
+            new_messages=new_messages,
+            cursor=_history_cursor(recent_history)
+        )
 
     except Exception as e:
         logger.error(f"Error invoking agent for user {current_user.email}: {e}")
+        await run_in_threadpool(_persist_turn, current_user.id, request.user_message, None) # Keep the user's message in history even if the agent failed
+        await _invalidate_cached_history(current_user.id) # Cached window no longer matches Postgres
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"An internal error occurred.")
 
+
+def _sse_event(payload: Dict) -> bytes:
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
+
+
+@app.post("/chat/stream/")
+async def chat_with_assistant_stream(
+    request: schemas.ChatRequest,
+    background_tasks: BackgroundTasks,
+    current_user: models.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Same as /chat/, but streams the answer token by token as server-sent events, so the client
+    renders text as soon as the model produces it. Events: {"type": "tool", "tool": ...} when a tool
+    is invoked, {"type": "output", "content": ...} per token chunk, then {"type": "done", "cursor": ...}
+    or {"type": "error", ...}.
+    """
+    recent_history, cache_hit = await _load_recent_history(current_user.id, db)
+    agent_input_data = _build_agent_input(request.user_message, current_user, recent_history)
+    executor = _build_executor(datetime.now().strftime("%Y-%m-%d"), compact=bool(recent_history))
+
+    async def _event_stream():
+        output_parts = []
+        final_output = None
+        completed = False # Set only once the whole answer and "done" have been sent
+        try:
+            async for event in executor.astream_events(agent_input_data, version="v2"):
+                kind = event["event"]
+                if kind == "on_chat_model_stream":
+                    token = event["data"]["chunk"].content
+                    if token: # Tool-call chunks carry no text
+                        output_parts.append(token)
+                        yield _sse_event({"type": "output", "content": token})
+                elif kind == "on_tool_start":
+                    yield _sse_event({"type": "tool", "tool": event["name"]})
+                elif kind == "on_chain_end" and not event["parent_ids"]: # The executor's own run finished
+                    final_output = event["data"]["output"].get("output")
+            if not output_parts and final_output:
+                # Nothing was streamed token by token (e.g. the executor stopped early); send the answer whole
+                output_parts.append(final_output)
+                yield _sse_event({"type": "output", "content": final_output})
+            yield _sse_event({"type": "done", "cursor": _history_cursor(recent_history)})
+            completed = True
+        except Exception as e:
+            logger.error("Error streaming agent response for user %s: %s", current_user.id, e)
+            yield _sse_event({"type": "error", "detail": "An internal error occurred."})
+        finally:
+            # Background tasks run once the stream has been fully sent. Save exactly the text the client
+            # was sent, which includes any text the model emitted on steps that went on to call tools.
+            # Errors and client disconnects (GeneratorExit/CancelledError) leave completed False, so a
+            # truncated answer is never saved or replayed to the model as a finished turn.
+            ai_response_content = "".join(output_parts)
+            if not completed or not ai_response_content:
+                background_tasks.add_task(_persist_turn, current_user.id, request.user_message, None)
+                background_tasks.add_task(_invalidate_cached_history, current_user.id)
+            else:
+                new_messages = [
+                    {"role": "human", "content": request.user_message},
+                    {"role": "ai", "content": ai_response_content}
+                ]
+                _schedule_turn_persistence(background_tasks, current_user.id, new_messages, recent_history, cache_hit)
+
+    return StreamingResponse(_event_stream(), media_type="text/event-stream", background=background_tasks)
+
 @app.get("/history/", response_model=List[schemas.ConversationHistory])
 def get_conversation_history(
     current_user: models.User = Depends(get_current_active_user),
     db: Session = Depends(get_db),
-    limit: int = 100
+    limit: int = 100,
+    since: Optional[int] = None,
+    before_id: Optional[int] = None
 ):
-    """Retrieves the conversation history for the current authenticated user."""
-    history_records = db.query(models.ConversationHistory).filter(
+    """
+    Retrieves the conversation history for the current authenticated user, oldest to newest.
+    By default returns the most recent `limit` messages. Pass before_id=<id of the oldest message
+    shown> to page further back, or since=<cursor> from a chat response to fetch only newer messages.
+    """
+    # Plain rows instead of ORM objects; the response schema reads them by attribute
+    history_records = db.query(
+        models.ConversationHistory.id,
+        models.ConversationHistory.user_id,
+        models.ConversationHistory.role,
+        models.ConversationHistory.content,
+        models.ConversationHistory.timestamp
+    ).filter(
         models.ConversationHistory.user_id == current_user.id
-    ).order_by(models.ConversationHistory.timestamp).limit(limit).all()
+    )
+    if since is not None:
+        # Catching up: the first `limit` messages after the cursor, in order
+        return _json_list_response(ConversationHistoryList, history_records.filter(models.ConversationHistory.id > since).order_by(
+            models.ConversationHistory.timestamp, models.ConversationHistory.id
+        ).limit(limit).all())
+
+    # Keyset pagination backwards from the newest message on the same (timestamp, id) key as the ORDER BY,
+    # so pages never skip or repeat rows; walks the (user_id, timestamp, id) index in reverse
+    if before_id is not None:
+        before_timestamp = select(models.ConversationHistory.timestamp).where(
+            models.ConversationHistory.id == before_id
+        ).scalar_subquery()
+        history_records = history_records.filter(
+            tuple_(models.ConversationHistory.timestamp, models.ConversationHistory.id) < tuple_(before_timestamp, before_id)
+        )
+    history_records = history_records.order_by(
+        models.ConversationHistory.timestamp.desc(), models.ConversationHistory.id.desc()
+    ).limit(limit).all()
 
-    return history_records
+    return _json_list_response(ConversationHistoryList, history_records[::-1])
 
 # --- Doctor Endpoints ---
 @app.post("/doctors/", response_model=schemas.Doctor)
@@ -318,19 +634,20 @@ def create_doctor(doctor: schemas.DoctorCreate, db: Session = Depends(get_db)):
     db_doctor = models.Doctor(name=doctor.name, specialty=doctor.specialty, email=doctor.email)
     db.add(db_doctor)
     db.commit()
-    db.refresh(db_doctor)
+    cache_doctor(db_doctor)
     return db_doctor
 
 @app.get("/doctors/", response_model=list[schemas.Doctor])
 def read_doctors(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
     """Retrieves a list of all doctors."""
-    doctors = db.query(models.Doctor).offset(skip).limit(limit).all()
-    return doctors
+    # The response embeds each doctor's user; load them in one extra query instead of one per row
+    doctors = db.query(models.Doctor).options(selectinload(models.Doctor.user)).offset(skip).limit(limit).all()
+    return _json_list_response(DoctorList, doctors)
 
 @app.get("/doctors/{doctor_id}", response_model=schemas.Doctor)
 def read_doctor(doctor_id: int, db: Session = Depends(get_db)):
     """Retrieves details for a specific doctor by ID."""
-    doctor = db.query(models.Doctor).filter(models.Doctor.id == doctor_id).first()
+    doctor = db.query(models.Doctor).options(joinedload(models.Doctor.user)).filter(models.Doctor.id == doctor_id).first()
     if doctor is None:
         raise HTTPException(status_code=404, detail="Doctor not found")
     return doctor
@@ -342,14 +659,13 @@ def create_patient(patient: schemas.PatientCreate, db: Session = Depends(get_db)
     db_patient = models.Patient(name=patient.name, email=patient.email, phone_number=patient.phone_number)
     db.add(db_patient)
     db.commit()
-    db.refresh(db_patient)
     return db_patient
 
 @app.get("/patients/", response_model=list[schemas.Patient])
 def read_patients(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
     """Retrieves a list of all patients."""
-    patients = db.query(models.Patient).offset(skip).limit(limit).all()
-    return patients
+    patients = db.query(models.Patient).options(selectinload(models.Patient.user)).offset(skip).limit(limit).all()
+    return _json_list_response(PatientList, patients)
 
 # --- Appointment Endpoints (Direct API Access - usually for internal tools or debugging) ---
 @app.get("/doctors/{doctor_id}/availability_direct/")
@@ -359,8 +675,8 @@ def check_doctor_availability_direct(
     db: Session = Depends(get_db)
 ):
     """Checks and returns direct availability for a doctor (without LLM involvement)."""
-    doctor = db.query(models.Doctor).filter(models.Doctor.id == doctor_id).first()
-    if not doctor:
+    doctor_name = db.scalar(select(models.Doctor.name).where(models.Doctor.id == doctor_id))
+    if doctor_name is None:
         raise HTTPException(status_code=404, detail="Doctor not found")
 
     try:
@@ -368,86 +684,84 @@ def check_doctor_availability_direct(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
 
-    booked_appointments = db.query(models.Appointment).filter(
+    booked_time_slots = set(db.scalars(select(models.Appointment.time_slot).where(
         models.Appointment.doctor_id == doctor_id,
         models.Appointment.appointment_date == requested_date
-    ).all()
-    booked_time_slots = {app.time_slot for app in booked_appointments}
+    )))
 
-    available_slots = []
-    for hour in range(9, 17):
-        for minute in [0, 30]:
-            time_str = f"{hour:02d}:{minute:02d}"
-            if time_str not in booked_time_slots:
-                available_slots.append(time_str)
+    available_slots = [slot for slot in ALL_SLOTS if slot not in booked_time_slots]
 
-    return {"doctor_name": doctor.name, "date": date, "available_slots": available_slots}
+    return {"doctor_name": doctor_name, "date": date, "available_slots": available_slots}
 
 @app.post("/appointments_direct/", response_model=schemas.Appointment)
 def book_appointment_direct(appointment: schemas.AppointmentCreate, db: Session = Depends(get_db)):
     """Directly books an appointment (without LLM or external API integrations)."""
-    doctor = db.query(models.Doctor).filter(models.Doctor.id == appointment.doctor_id).first()
-    patient = db.query(models.Patient).filter(models.Patient.id == appointment.patient_id).first()
+    # Both existence checks in a single round trip
+    checks = db.execute(select(
+        exists().where(models.Doctor.id == appointment.doctor_id).label("doctor_exists"),
+        exists().where(models.Patient.id == appointment.patient_id).label("patient_exists"),
+    )).one()
 
-    if not doctor:
+    if not checks.doctor_exists:
         raise HTTPException(status_code=404, detail="Doctor not found")
-    if not patient:
+    if not checks.patient_exists:
         raise HTTPException(status_code=404, detail="Patient not found")
 
-    existing_appointment = db.query(models.Appointment).filter(
-        models.Appointment.doctor_id == appointment.doctor_id,
-        models.Appointment.appointment_date == appointment.appointment_date,
-        models.Appointment.time_slot == appointment.time_slot
+    # The unique (doctor_id, appointment_date, time_slot) index makes the slot check atomic with the insert
+    db_appointment = db.scalars(
+        pg_insert(models.Appointment).values(
+            doctor_id=appointment.doctor_id,
+            patient_id=appointment.patient_id,
+            appointment_date=appointment.appointment_date,
+            time_slot=appointment.time_slot,
+            status="pending"
+        ).on_conflict_do_nothing().returning(models.Appointment)
     ).first()
-
-    if existing_appointment:
+    if db_appointment is None:
+        db.rollback()
         raise HTTPException(status_code=409, detail="Time slot already booked for this doctor.")
-
-    db_appointment = models.Appointment(
-        doctor_id=appointment.doctor_id,
-        patient_id=appointment.patient_id,
-        appointment_date=appointment.appointment_date,
-        time_slot=appointment.time_slot,
-        status="pending"
-    )
-    db.add(db_appointment)
     db.commit()
-    db.refresh(db_appointment)
 
-    return db_appointment
+    # The response nests doctor and patient (each with its user); fetch them in one joined query
+    # rather than four lazy loads during serialisation
+    return db.scalars(
+        select(models.Appointment).options(
+            joinedload(models.Appointment.doctor).joinedload(models.Doctor.user),
+            joinedload(models.Appointment.patient).joinedload(models.Patient.user)
+        ).where(models.Appointment.id == db_appointment.id)
+    ).one()
 
 @app.get("/doctors/{doctor_id}/summary_report_direct/")
 def get_doctor_summary_report_direct(doctor_id: int, db: Session = Depends(get_db)):
     """Directly retrieves a summary report for a doctor (without LLM involvement)."""
-    doctor = db.query(models.Doctor).filter(models.Doctor.id == doctor_id).first()
-    if not doctor:
-        raise HTTPException(status_code=404, detail="Doctor not found")
-
     today = datetime.now().date()
     yesterday = today - timedelta(days=1)
 
-    total_patients_visited = db.query(models.Appointment).filter(
-        models.Appointment.doctor_id == doctor_id,
-        models.Appointment.status == "completed"
-    ).count()
-
-    appointments_today = db.query(models.Appointment).filter(
-        models.Appointment.doctor_id == doctor_id,
-        models.Appointment.appointment_date == today,
-        models.Appointment.status.in_(["pending", "confirmed"])
-    ).count()
-
-    appointments_yesterday = db.query(models.Appointment).filter(
-        models.Appointment.doctor_id == doctor_id,
-        models.Appointment.appointment_date == yesterday,
-        models.Appointment.status.in_(["completed", "pending", "confirmed"])
-    ).count()
+    # Doctor lookup and all three counts in a single round trip (COUNT ... FILTER, one pass over the doctor's rows)
+    report = db.query(
+        models.Doctor.name,
+        func.count(models.Appointment.id).filter(
+            models.Appointment.status == "completed"
+        ).label("total_patients_visited"),
+        func.count(models.Appointment.id).filter(and_(
+            models.Appointment.appointment_date == today,
+            models.Appointment.status.in_(["pending", "confirmed"])
+        )).label("appointments_today"),
+        func.count(models.Appointment.id).filter(and_(
+            models.Appointment.appointment_date == yesterday,
+            models.Appointment.status.in_(["completed", "pending", "confirmed"])
+        )).label("appointments_yesterday"),
+    ).outerjoin(
+        models.Appointment, models.Appointment.doctor_id == models.Doctor.id
+    ).filter(models.Doctor.id == doctor_id).group_by(models.Doctor.id).first()
+    if not report:
+        raise HTTPException(status_code=404, detail="Doctor not found")
 
     summary = {
-        "doctor_name": doctor.name,
-        "total_patients_visited": total_patients_visited,
-        "appointments_today": appointments_today,
-        "appointments_yesterday": appointments_yesterday,
-        "report_generated_at": datetime.now().isoformat()
+        "doctor_name": report.name,
+        "total_patients_visited": report.total_patients_visited,
+        "appointments_today": report.appointments_today,
+        "appointments_yesterday": report.appointments_yesterday,
+        "report_generated_at": datetime.now()
     }
     return summary
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base # Corrected to use relative import
@@ -59,6 +59,12 @@ class Appointment(Base):
     doctor = relationship("Doctor", back_populates="appointments")
     patient = relationship("Patient", back_populates="appointments")
 
+    __table_args__ = (
+        Index("ix_appointments_doctor_id_date_status", "doctor_id", "appointment_date", "status"), # Per-doctor daily lookups and reports
+        Index("uq_doctor_slot", "doctor_id", "appointment_date", "time_slot", unique=True), # One booking per doctor per slot
+        Index("ix_appointments_doctor_id_status", "doctor_id", "status"), # All-time per-status counts (e.g. patients visited)
+    )
+
 class ConversationHistory(Base):
     """SQLAlchemy model for storing user-AI conversation history."""
     __tablename__ = "conversation_history"
@@ -68,4 +74,15 @@ class ConversationHistory(Base):
     content = Column(String, nullable=False)
     timestamp = Column(DateTime, server_default=func.now())
 
-    user = relationship("User")
\ No newline at end of file
+    user = relationship("User")
+
+    __table_args__ = (
+        Index("ix_conversation_history_user_id_timestamp_id", "user_id", "timestamp", "id"), # Recent-history lookups and keyset paging per user
+    )
+
+
+def create_missing_indexes(bind):
+    """Creates indexes that were added to models after their tables already existed (create_all skips those tables)."""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
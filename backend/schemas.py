@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
 from datetime import datetime
 from typing import Optional, List, Dict
 
@@ -20,16 +20,14 @@ class UserInDB(UserBase):
     role: str
     is_active: bool
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class User(UserBase):
     id: int
     role: str
     is_active: bool
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 # --- Authentication Token Schemas ---
 class Token(BaseModel):
@@ -52,8 +50,7 @@ class Doctor(DoctorBase):
     id: int
     user_id: Optional[int] = None 
     user: Optional[User] = None 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 # --- Patient Schemas ---
 class PatientBase(BaseModel):
@@ -69,8 +66,7 @@ class Patient(PatientBase):
     user_id: Optional[int] = None
     user: Optional[User] = None
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 # --- Appointment Schemas ---
 class AppointmentBase(BaseModel):
@@ -93,14 +89,16 @@ class Appointment(AppointmentBase):
     doctor: Optional[Doctor] = None
     patient: Optional[Patient] = None
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 # --- Tool Input Schemas (for LLM Function Calling) ---
 class CheckDoctorAvailabilityInput(BaseModel):
     doctor_name: str = Field(..., description="The full name of the doctor (e.g., 'Dr. Ahuja').")
     date: str = Field(..., description="The date to check availability in YYYY-MM-DD format (e.g., '2025-07-02').")
 
+class CheckAnyDoctorAvailabilityInput(BaseModel):
+    date: str = Field(..., description="The date to check availability in YYYY-MM-DD format (e.g., '2025-07-02').")
+
 class BookAppointmentInput(BaseModel):
     doctor_name: str = Field(..., description="The full name of the doctor.")
     patient_name: str = Field(..., description="The full name of the patient.")
@@ -120,11 +118,15 @@ class GetDoctorSummaryReportInput(BaseModel):
 # --- Chat & Conversation History Schemas ---
 class ChatRequest(BaseModel):
     user_message: str
-    chat_history: List[Dict] = []
+
+class ChatMessage(BaseModel):
+    role: str
+    content: str
 
 class ChatResponse(BaseModel):
     ai_response: str
-    updated_chat_history: List[Dict]
+    new_messages: List[ChatMessage]
+    cursor: Optional[int] = None # Newest saved message id the reply was based on; use with /history/?since=
 
 class ConversationHistoryBase(BaseModel):
     user_id: int
@@ -138,5 +140,4 @@ class ConversationHistory(ConversationHistoryBase):
     id: int
     timestamp: datetime
 
-    class Config:
-        from_attributes = True
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
@@ -1,24 +1,50 @@
 # Standard library imports
 from datetime import datetime, timedelta, time
 import logging
-from typing import Dict,List, Optional # Only import types directly used in this file's function signatures
+import threading
+from time import monotonic
+from typing import Dict,List, NamedTuple, Optional # Only import types directly used in this file's function signatures
 
 # Third-party library imports
 from fastapi import Depends, HTTPException # Keep if these are used in tool functions (HttpException is used)
-from sqlalchemy.orm import Session
-from googleapiclient.errors import HttpError
+from fastapi.concurrency import run_in_threadpool
+from cachetools import TTLCache
+from sqlalchemy import bindparam, delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, selectinload
+import httpx
+from google.auth.exceptions import GoogleAuthError
 from pydantic import EmailStr # Keep EmailStr as it's used in book_appointment_tool signature
 
 # Local application imports (Corrected relative imports)
 import models
 import schemas
-from database import get_db
-from calendar_service import get_calendar_service, create_calendar_event, get_free_busy_slots
-from email_service import send_confirmation_email
+from database import SessionLocal
+from calendar_service import CALENDAR_TIMEZONE, get_calendar_service, create_calendar_event_async, get_free_busy_slots_async, aget_free_busy_slots_for_calendars
+from email_service import send_confirmation_email_background
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
+# Errors a Calendar round trip can raise past the calendar_service helpers: transport and auth
+# failures, plus ValueError (incl. JSONDecodeError) / KeyError from an unexpected response body
+CALENDAR_ERRORS = (httpx.HTTPError, GoogleAuthError, ValueError, KeyError)
+
+# Bookable 30-minute slots, 09:00-16:30 clinic time, already in order
+CLINIC_TIMEZONE = CALENDAR_TIMEZONE # Same zone calendar_service asks Google to answer in
+SLOT_MINUTES = 30
+ALL_SLOTS = tuple(f"{h:02d}:{m:02d}" for h in range(9, 17) for m in (0, 30))
+# A day's occupancy is an int bitmask over ALL_SLOTS: bit i set means ALL_SLOTS[i] is taken
+SLOT_INDEX = {slot: i for i, slot in enumerate(ALL_SLOTS)}
+ALL_SLOTS_MASK = (1 << len(ALL_SLOTS)) - 1
+
+# Raw Google Calendar busy intervals per (calendar_id, week's Monday). One free/busy query covers the
+# whole week, so availability questions about other days of that week are answered from memory.
+# Dropped for a calendar/week when we book into it.
+WEEK_BUSY_CACHE_TTL_SECONDS = 180
+_week_busy_cache = TTLCache(maxsize=512, ttl=WEEK_BUSY_CACHE_TTL_SECONDS)
+
 # Initialize Google Calendar service once on startup
 gcal_service = get_calendar_service()
 if not gcal_service:
@@ -26,34 +52,224 @@ if not gcal_service:
 
 
 # --- Helper Functions ---
-def _get_db_session():
-    """Provides a SQLAlchemy database session."""
-    db_session = get_db()
-    try:
-        db = next(db_session)
-        yield db
-    finally:
-        if 'db' in locals() and db:
-            db.close()
-
-def _get_doctor_by_name(db: Session, doctor_name: str):
-    """Retrieves a doctor by name from the database."""
-    return db.query(models.Doctor).filter(models.Doctor.name.ilike(doctor_name)).first()
+# Hot lookups built once with bound parameters, so each call reuses the same statement object
+# (and SQLAlchemy's compiled-SQL cache entry) instead of rebuilding the expression tree.
+_STMT_DOCTOR_BY_NAME = select(models.Doctor).where(models.Doctor.name.ilike(bindparam("name"))).limit(1)
+_STMT_PATIENT_BY_EMAIL = select(models.Patient).where(models.Patient.email == bindparam("email")).limit(1)
+_STMT_BOOKED_SLOTS = select(models.Appointment.time_slot).where(
+    models.Appointment.doctor_id == bindparam("doctor_id"),
+    models.Appointment.appointment_date == bindparam("day")
+)
+
+class DoctorRef(NamedTuple):
+    """Lightweight, session-independent view of a doctor row for the tools' name lookups."""
+    id: int
+    name: str
+    specialty: str
+    email: str
+
+# Doctor name (lower-cased) -> DoctorRef. Loaded on startup and kept current by cache_doctor(),
+# so resolving a doctor named by the LLM doesn't cost a DB round trip on every tool call.
+# The whole index is reloaded once it is older than the TTL, so renames/removals made by other
+# processes are picked up without every entry falling back to the DB at the same moment.
+DOCTOR_INDEX_TTL_SECONDS = 300
+_doctor_index: Dict[str, DoctorRef] = {}
+_doctor_index_loaded_at: Optional[float] = None # monotonic() of the last full load; None = never loaded
+_doctor_index_lock = threading.Lock()
+
+# list_all_doctors_tool's result; the doctor table changes rarely
+DOCTORS_LIST_CACHE_TTL_SECONDS = 300
+_doctors_list_cache = TTLCache(maxsize=1, ttl=DOCTORS_LIST_CACHE_TTL_SECONDS)
+_doctors_list_lock = threading.Lock()
+
+def invalidate_doctors_cache():
+    """Drops the cached doctor list; call after any change to the Doctor table."""
+    with _doctors_list_lock:
+        _doctors_list_cache.clear()
+
+def _doctor_ref(doctor: models.Doctor) -> DoctorRef:
+    return DoctorRef(id=doctor.id, name=doctor.name, specialty=doctor.specialty, email=doctor.email)
+
+def load_doctor_index(db: Session):
+    """(Re)builds the doctor name index from the database."""
+    global _doctor_index_loaded_at
+    rows = db.query(models.Doctor.id, models.Doctor.name, models.Doctor.specialty, models.Doctor.email).all()
+    index = {row.name.lower(): DoctorRef(*row) for row in rows}
+    with _doctor_index_lock:
+        _doctor_index.clear()
+        _doctor_index.update(index)
+        _doctor_index_loaded_at = monotonic()
+    invalidate_doctors_cache()
+    logger.info("Loaded %s doctors into the name index.", len(index))
+
+def _index_doctor(doctor: models.Doctor):
+    """Adds or updates one doctor in the name index only."""
+    with _doctor_index_lock:
+        _doctor_index[doctor.name.lower()] = _doctor_ref(doctor)
+
+def cache_doctor(doctor: models.Doctor):
+    """Adds a newly created doctor to the name index and drops the cached list (call after creating a doctor)."""
+    _index_doctor(doctor)
+    invalidate_doctors_cache()
+
+def _lookup_fresh_doctor(doctor_name: str) -> tuple[bool, Optional[DoctorRef]]:
+    """Returns (index is fresh, indexed doctor or None)."""
+    with _doctor_index_lock:
+        fresh = _doctor_index_loaded_at is not None and monotonic() - _doctor_index_loaded_at < DOCTOR_INDEX_TTL_SECONDS
+        return fresh, _doctor_index.get(doctor_name.lower())
+
+def _get_doctor_by_name(db: Session, doctor_name: str) -> Optional[DoctorRef]:
+    """Retrieves a doctor by name (case-insensitive), from the index when possible."""
+    fresh, doctor = _lookup_fresh_doctor(doctor_name)
+    if not fresh:
+        # One query refreshes every entry at once
+        load_doctor_index(db)
+        fresh, doctor = _lookup_fresh_doctor(doctor_name)
+    if doctor is not None:
+        return doctor
+    db_doctor = db.scalars(_STMT_DOCTOR_BY_NAME, {"name": doctor_name}).first()
+    if db_doctor is None:
+        return None
+    # A doctor created by another process since the last load; the list cache has its own TTL for that
+    _index_doctor(db_doctor)
+    return _doctor_ref(db_doctor)
+
+async def _aget_doctor_by_name(db: Session, doctor_name: str) -> Optional[DoctorRef]:
+    """_get_doctor_by_name for the async tools: fresh index hits return directly, the rest query the DB off the event loop."""
+    fresh, doctor = _lookup_fresh_doctor(doctor_name)
+    if fresh and doctor is not None:
+        return doctor
+    return await run_in_threadpool(_get_doctor_by_name, db, doctor_name)
 
 def _get_patient_by_name_or_create(db: Session, patient_name: str, patient_email: str):
     """Retrieves a patient by email or creates a new one if not found."""
-    patient = db.query(models.Patient).filter(models.Patient.email == patient_email).first()
+    patient = db.scalars(_STMT_PATIENT_BY_EMAIL, {"email": patient_email}).first()
     if not patient:
         patient = models.Patient(name=patient_name, email=patient_email)
         db.add(patient)
         db.commit()
-        db.refresh(patient)
     return patient
 
+def _slots_mask(slots) -> int:
+    """Bitmask of the given slot labels (labels outside ALL_SLOTS are ignored)."""
+    mask = 0
+    for slot in slots:
+        if slot in SLOT_INDEX:
+            mask |= 1 << SLOT_INDEX[slot]
+    return mask
+
+def _available_slots(occupied_mask: int) -> List[str]:
+    """Slot labels, in order, whose bit is clear in occupied_mask."""
+    free_mask = ALL_SLOTS_MASK & ~occupied_mask
+    return [slot for i, slot in enumerate(ALL_SLOTS) if free_mask >> i & 1]
+
+def _get_booked_mask(db: Session, doctor_id: int, day) -> int:
+    """Bitmask of the time slots already booked in the DB for a doctor on a date."""
+    # Only the time_slot column; no Appointment objects are built
+    return _slots_mask(db.scalars(_STMT_BOOKED_SLOTS, {"doctor_id": doctor_id, "day": day}))
+
+def _get_doctors_and_booked_slots(db: Session, day):
+    """All doctors, plus a booked-slot bitmask per doctor for a date, in two queries."""
+    doctors = db.query(models.Doctor.id, models.Doctor.name, models.Doctor.specialty, models.Doctor.email).all()
+    booked_by_doctor: Dict[int, int] = {}
+    for doctor_id, time_slot in db.query(models.Appointment.doctor_id, models.Appointment.time_slot).filter(
+        models.Appointment.appointment_date == day
+    ):
+        booked_by_doctor[doctor_id] = booked_by_doctor.get(doctor_id, 0) | _slots_mask((time_slot,))
+    return doctors, booked_by_doctor
+
+def _release_slot(db: Session, appointment_id: int):
+    """Deletes a booking's "pending" claim row so the slot can be booked again."""
+    try:
+        db.rollback() # The session may be mid-failure
+        db.execute(
+            delete(models.Appointment).where(
+                models.Appointment.id == appointment_id,
+                models.Appointment.status == "pending"
+            )
+        )
+        db.commit()
+    except SQLAlchemyError as error:
+        logger.error("Could not release pending appointment %s: %s", appointment_id, error)
+
+def _week_start(day) -> datetime:
+    """Monday 00:00 clinic time of the week containing `day`."""
+    return datetime.combine(day - timedelta(days=day.weekday()), time(0, 0, 0), tzinfo=CLINIC_TIMEZONE)
+
+async def _get_week_busy(doctor_calendar_id: str, monday: datetime) -> Optional[List[Dict]]:
+    """
+    Returns the doctor's Google Calendar busy intervals for the week starting at `monday`,
+    or None when Google could not be asked. Failed lookups are never cached.
+    """
+    key = (doctor_calendar_id, monday)
+    busy_periods = _week_busy_cache.get(key)
+    if busy_periods is None:
+        busy_periods = await get_free_busy_slots_async(doctor_calendar_id, monday, monday + timedelta(days=7))
+        if busy_periods is not None:
+            _week_busy_cache[key] = busy_periods
+    return busy_periods
+
+def _parse_gcal_time(value: str) -> datetime:
+    """Parses a free/busy timestamp; Google may use a trailing 'Z' for UTC."""
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+def _busy_mask_on(busy_periods: List[Dict], requested_date) -> int:
+    """Slices a week's busy intervals down to a bitmask of the slots they overlap on one date."""
+    start_of_day = datetime.combine(requested_date, time(9, 0, 0), tzinfo=CLINIC_TIMEZONE)
+    day_minutes = len(ALL_SLOTS) * SLOT_MINUTES
+    busy_mask = 0
+    for busy in busy_periods:
+        # Minutes since 09:00 clinic time, clamped to the bookable day
+        s_min = max(0, int((_parse_gcal_time(busy['start']) - start_of_day).total_seconds() // 60))
+        e_min = min(day_minutes, int((_parse_gcal_time(busy['end']) - start_of_day).total_seconds() // 60))
+        if e_min > s_min:
+            # Bits [first, last) for the slots the interval touches
+            first, last = s_min // SLOT_MINUTES, -(-e_min // SLOT_MINUTES)
+            busy_mask |= ((1 << last) - 1) & ~((1 << first) - 1)
+    return busy_mask
+
+async def _is_slot_busy_cached(doctor_calendar_id: str, day, time_slot: str, start: datetime, end: datetime) -> Optional[bool]:
+    """
+    Whether Google Calendar has the doctor busy in a slot, or None if that could not be determined.
+    Answered from the week's busy intervals, which are usually already cached by the availability
+    check that preceded the booking; slots outside ALL_SLOTS fall back to a free/busy query for just that window.
+    """
+    if time_slot in SLOT_INDEX:
+        week_busy = await _get_week_busy(doctor_calendar_id, _week_start(day))
+        if week_busy is None:
+            return None
+        return bool(_busy_mask_on(week_busy, day) >> SLOT_INDEX[time_slot] & 1)
+    busy_periods = await get_free_busy_slots_async(doctor_calendar_id, start, end)
+    return None if busy_periods is None else bool(busy_periods)
+
 def _get_all_doctors(db: Session) -> List[Dict]:
-    """Fetches all doctors from the database."""
-    doctors = db.query(models.Doctor).all()
-    return [{"name": doc.name, "specialty": doc.specialty, "email": doc.email} for doc in doctors]
+    """Fetches all doctors, from the list cache when it is fresh. Callers must not mutate the result."""
+    with _doctors_list_lock:
+        doctors_data = _doctors_list_cache.get("all")
+    if doctors_data is None:
+        doctors = db.query(models.Doctor.name, models.Doctor.specialty, models.Doctor.email).all()
+        doctors_data = [{"name": doc.name, "specialty": doc.specialty, "email": doc.email} for doc in doctors]
+        with _doctors_list_lock:
+            _doctors_list_cache["all"] = doctors_data
+    return doctors_data
+
+
+CONFIRMATION_EMAIL_SUBJECT = "Appointment Confirmation: Dr. {doctor} - {date} {time_slot}"
+CONFIRMATION_EMAIL_BODY = """
+Dear {patient},
+
+Your appointment with Dr. {doctor} on {date} at {time_slot} has been successfully confirmed.
+
+We look forward to seeing you.
+
+Best regards,
+Smart Doctor Assistant
+"""
+
+def _confirmation_email(patient_name: str, doctor_name: str, date: str, time_slot: str):
+    """Subject and body of the booking confirmation email."""
+    fields = {"patient": patient_name, "doctor": doctor_name, "date": date, "time_slot": time_slot}
+    return CONFIRMATION_EMAIL_SUBJECT.format(**fields), CONFIRMATION_EMAIL_BODY.format(**fields)
 
 
 # --- Tool Functions (for LLM Agent) ---
@@ -66,11 +282,8 @@ async def check_doctor_availability_tool(
     """
     Checks available time slots for a doctor on a given date, considering DB and Google Calendar busy times.
     """
-    db_gen = _get_db_session()
-    db = next(db_gen)
-
-    try:
-        doctor = _get_doctor_by_name(db, doctor_name)
+    with SessionLocal() as db:
+        doctor = await _aget_doctor_by_name(db, doctor_name)
         if not doctor:
             return {"error": f"Doctor '{doctor_name}' not found."}
 
@@ -80,47 +293,21 @@ async def check_doctor_availability_tool(
 
         try:
             requested_date = datetime.strptime(date, "%Y-%m-%d").date()
-            start_of_day = datetime.combine(requested_date, time(9, 0, 0))
-            end_of_day = datetime.combine(requested_date, time(17, 0, 0))
         except ValueError:
             return {"error": "Invalid date format. Please use `YYYY-MM-DD`."}
 
-        all_possible_slots = []
-        for hour in range(9, 17):
-            for minute in [0, 30]:
-                all_possible_slots.append(f"{hour:02d}:{minute:02d}")
-
-        gcal_busy_slots = []
+        gcal_busy_mask = 0
         if gcal_service:
-            try:
-                busy_periods = get_free_busy_slots(gcal_service, doctor_calendar_id, start_of_day, end_of_day)
-                for busy in busy_periods:
-                    # Ensure timezone awareness for comparison
-                    busy_start = datetime.fromisoformat(busy['start']).astimezone(datetime.timezone.utc).astimezone(start_of_day.tzinfo)
-                    busy_end = datetime.fromisoformat(busy['end']).astimezone(datetime.timezone.utc).astimezone(end_of_day.tzinfo)
-                    
-                    current_time = busy_start
-                    while current_time < busy_end:
-                        gcal_busy_slots.append(current_time.strftime("%H:%M"))
-                        current_time += timedelta(minutes=30)
-            except HttpError as error:
-                logger.error(f"Error getting free/busy slots from Google Calendar: {error}")
-                # Continue without calendar data if API fails, but inform user
-                return {"error": f"Could not retrieve Google Calendar availability: {error}. Please try again later."}
-
-        booked_appointments_db = db.query(models.Appointment).filter(
-            models.Appointment.doctor_id == doctor.id,
-            models.Appointment.appointment_date == requested_date
-        ).all()
-        db_booked_time_slots = {app.time_slot for app in booked_appointments_db}
-
-        all_occupied_slots = set(gcal_busy_slots) | db_booked_time_slots
-        available_slots = [slot for slot in all_possible_slots if slot not in all_occupied_slots]
-        available_slots.sort()
+            week_busy = await _get_week_busy(doctor_calendar_id, _week_start(requested_date))
+            if week_busy is None:
+                return {"error": "Could not retrieve Google Calendar availability. Please try again later."}
+            gcal_busy_mask = _busy_mask_on(week_busy, requested_date)
+
+        db_booked_mask = await run_in_threadpool(_get_booked_mask, db, doctor.id, requested_date)
+
+        available_slots = _available_slots(gcal_busy_mask | db_booked_mask)
 
         return {"doctor_name": doctor.name, "date": date, "available_slots": available_slots}
-    finally:
-        db.close()
 
 async def book_appointment_tool(
     doctor_name: str,
@@ -134,116 +321,169 @@ async def book_appointment_tool(
     """
     Books an appointment, creates a Google Calendar event, and sends email confirmation.
     """
-    db_gen = _get_db_session()
-    db = next(db_gen)
-
-    try:
-        doctor = _get_doctor_by_name(db, doctor_name)
-        if not doctor:
-            return {"error": f"Doctor '{doctor_name}' not found."}
+    gcal_event_id = None
+    with SessionLocal() as db:
+        try:
+            doctor = await _aget_doctor_by_name(db, doctor_name)
+            if not doctor:
+                return {"error": f"Doctor '{doctor_name}' not found."}
         
-        doctor_calendar_id = doctor.email
-        if not doctor_calendar_id:
-            return {"error": f"Doctor '{doctor_name}' does not have an email/calendar ID configured for Google Calendar."}
+            doctor_calendar_id = doctor.email
+            if not doctor_calendar_id:
+                return {"error": f"Doctor '{doctor_name}' does not have an email/calendar ID configured for Google Calendar."}
 
-        patient = _get_patient_by_name_or_create(db, patient_name, patient_email)
+            patient = await run_in_threadpool(_get_patient_by_name_or_create, db, patient_name, patient_email)
 
-        try:
-            appointment_date_obj = datetime.strptime(date, "%Y-%m-%d").date()
-            start_hour, start_minute = map(int, time_slot.split(':'))
-            start_event_datetime = datetime.combine(appointment_date_obj, time(start_hour, start_minute, 0))
-            end_event_datetime = start_event_datetime + timedelta(minutes=30)
-        except ValueError:
-            return {"error": "Invalid date or time slot format. Use `YYYY-MM-DD` and `HH:MM`."}
-        
-        # Check for existing appointment in DB before creating calendar event
-        existing_appointment_db = db.query(models.Appointment).filter(
-            models.Appointment.doctor_id == doctor.id,
-            models.Appointment.appointment_date == appointment_date_obj,
-            models.Appointment.time_slot == time_slot
-        ).first()
-        if existing_appointment_db:
-            return {"error": f"Time slot '{time_slot}' on {date} already booked for {doctor.name} in our records."}
-
-        # Check Google Calendar busy status one last time for robustness
-        if gcal_service:
             try:
-                busy_periods = get_free_busy_slots(gcal_service, doctor_calendar_id, start_event_datetime, end_event_datetime)
-                if busy_periods:
-                    return {"error": f"Doctor '{doctor.name}' is unexpectedly busy at {time_slot} on {date} according to Google Calendar. Please choose another slot."}
-            except HttpError as error:
-                logger.error(f"Error confirming Google Calendar availability: {error}")
-                return {"error": f"Could not confirm Google Calendar availability: {error}. Please try again later."}
+                appointment_date_obj = datetime.strptime(date, "%Y-%m-%d").date()
+                start_hour, start_minute = map(int, time_slot.split(':'))
+                start_event_datetime = datetime.combine(appointment_date_obj, time(start_hour, start_minute, 0), tzinfo=CLINIC_TIMEZONE)
+                end_event_datetime = start_event_datetime + timedelta(minutes=30)
+            except ValueError:
+                return {"error": "Invalid date or time slot format. Use `YYYY-MM-DD` and `HH:MM`."}
         
-        # Create Google Calendar Event
-        gcal_event_id = None
-        if gcal_service:
-            event_summary = f"Appointment: Dr. {doctor.name} & {patient.name}"
-            event_description = f"Patient: {patient.name}\nEmail: {patient.email}\nNotes: {notes if notes else 'N/A'}"
-            
-            attendees = [{'email': doctor_calendar_id}]
-            if patient.email:
-                attendees.append({'email': patient.email})
-
-            gcal_event_id = create_calendar_event(
-                gcal_service,
-                calendar_id=doctor_calendar_id,
-                summary=event_summary,
-                description=event_description,
-                start_datetime=start_event_datetime,
-                end_datetime=end_event_datetime,
-                attendees=attendees
+            # Claim the slot before touching the calendar: one INSERT that skips on the uq_doctor_slot index,
+            # committed right away as "pending" so no transaction (or row lock) stays open across the
+            # Google calls. A concurrent booking of the same slot gets None immediately.
+            appointment_id = await run_in_threadpool(
+                db.scalar,
+                pg_insert(models.Appointment).values(
+                    doctor_id=doctor.id,
+                    patient_id=patient.id,
+                    appointment_date=appointment_date_obj,
+                    time_slot=time_slot,
+                    status="pending",
+                    notes=notes
+                ).on_conflict_do_nothing(
+                    index_elements=[models.Appointment.doctor_id, models.Appointment.appointment_date, models.Appointment.time_slot]
+                ).returning(models.Appointment.id)
             )
-            if not gcal_event_id:
-                return {"error": "Failed to create Google Calendar event. Appointment not booked."}
-        else:
-            logger.warning("Google Calendar service not available. Proceeding without calendar event.")
-
-        # Store the appointment in database
-        db_appointment = models.Appointment(
-            doctor_id=doctor.id,
-            patient_id=patient.id,
-            appointment_date=appointment_date_obj,
-            time_slot=time_slot,
-            status="confirmed",
-            notes=notes,
-            google_calendar_event_id=gcal_event_id
-        )
-        db.add(db_appointment)
-        db.commit()
-        db.refresh(db_appointment)
-        
-        # Send confirmation email
-        email_subject = f"Appointment Confirmation: Dr. {doctor.name} - {date} {time_slot}"
-        email_body = f"""
-Dear {patient.name},
+            if appointment_id is None:
+                return {"error": f"Time slot '{time_slot}' on {date} already booked for {doctor.name} in our records."}
+            await run_in_threadpool(db.commit)
 
-Your appointment with Dr. {doctor.name} on {date} at {time_slot} has been successfully confirmed.
+            confirmed = False
+            try:
+                # Check Google Calendar busy status one last time for robustness; fail closed if Google can't be asked
+                if gcal_service:
+                    slot_busy = await _is_slot_busy_cached(doctor_calendar_id, appointment_date_obj, time_slot, start_event_datetime, end_event_datetime)
+                    if slot_busy is None:
+                        return {"error": "Could not confirm Google Calendar availability. Please try again later."}
+                    if slot_busy:
+                        return {"error": f"Doctor '{doctor.name}' is unexpectedly busy at {time_slot} on {date} according to Google Calendar. Please choose another slot."}
+        
+                # Create Google Calendar Event
+                if gcal_service:
+                    event_summary = f"Appointment: Dr. {doctor.name} & {patient.name}"
+                    event_description = f"Patient: {patient.name}\nEmail: {patient.email}\nNotes: {notes if notes else 'N/A'}"
+            
+                    attendees = [{'email': doctor_calendar_id}]
+                    if patient.email:
+                        attendees.append({'email': patient.email})
+
+                    gcal_event_id = await create_calendar_event_async(
+                        calendar_id=doctor_calendar_id,
+                        summary=event_summary,
+                        description=event_description,
+                        start_datetime=start_event_datetime,
+                        end_datetime=end_event_datetime,
+                        attendees=attendees
+                    )
+                    if not gcal_event_id:
+                        return {"error": "Failed to create Google Calendar event. Appointment not booked."}
+                    _week_busy_cache.pop((doctor_calendar_id, _week_start(appointment_date_obj)), None) # The doctor's week just changed
+                else:
+                    logger.warning("Google Calendar service not available. Proceeding without calendar event.")
+
+                # Confirm the booking and link the calendar event
+                await run_in_threadpool(
+                    db.execute,
+                    update(models.Appointment)
+                    .where(models.Appointment.id == appointment_id)
+                    .values(status="confirmed", google_calendar_event_id=gcal_event_id)
+                )
+                await run_in_threadpool(db.commit)
+                confirmed = True
+            finally:
+                if not confirmed: # Calendar step failed, errored or was cancelled: give the slot back
+                    await run_in_threadpool(_release_slot, db, appointment_id)
+
+        except SQLAlchemyError as error:
+            logger.error("Database error during booking: %s", error)
+            await run_in_threadpool(db.rollback)
+            if gcal_event_id:
+                logger.error("Google Calendar event %s was created for a booking that was not saved.", gcal_event_id)
+            return {"error": "Could not save the appointment. Please try again."}
+        except CALENDAR_ERRORS as error:
+            # Transport/auth failures, or a malformed Calendar response, that the async helpers let through.
+            # The pending slot claim has already been released by the inner finally.
+            logger.error("Google Calendar error during booking: %s", error)
+            return {"error": "Could not reach Google Calendar to complete the booking. Please try again later."}
+
+    # Send confirmation email
+    email_subject, email_body = _confirmation_email(patient.name, doctor.name, date, time_slot)
+    send_confirmation_email_background(patient.email, email_subject, email_body)
+
+    return {
+        "success": True,
+        "message": f"Appointment confirmed for {patient.name} with {doctor.name} on {date} at {time_slot}. A confirmation email has been sent to {patient.email}.",
+        "appointment_id": appointment_id,
+        "google_calendar_event_id": gcal_event_id,
+        "confirmation_email_to": patient.email
+    }
+
+async def check_any_doctor_availability_tool(date: str, user_info: Dict = None) -> Dict:
+    """
+    Lists every doctor's available time slots on a given date, fetching all of their
+    Google Calendars in one batched free/busy query.
+    """
+    with SessionLocal() as db:
+        try:
+            requested_date = datetime.strptime(date, "%Y-%m-%d").date()
+        except ValueError:
+            return {"error": "Invalid date format. Please use `YYYY-MM-DD`."}
 
-We look forward to seeing you.
+        doctors, booked_by_doctor = await run_in_threadpool(_get_doctors_and_booked_slots, db, requested_date)
+        if not doctors:
+            return {"message": "No doctors found in the system at the moment."}
 
-Best regards,
-Smart Doctor Assistant
-"""
-        send_confirmation_email(patient.email, email_subject, email_body)
-
-        return {
-            "success": True,
-            "message": f"Appointment confirmed for {patient.name} with {doctor.name} on {date} at {time_slot}. A confirmation email has been sent to {patient.email}.",
-            "appointment_id": db_appointment.id,
-            "google_calendar_event_id": gcal_event_id,
-            "confirmation_email_to": patient.email
-        }
-    except HttpError as error: # Catch HttpError from Google Calendar API specifically
-        logger.error(f"Google Calendar API error during booking: {error}")
-        db.rollback() # Rollback DB changes if calendar creation failed (important!)
-        return {"error": f"An external API error occurred during booking: {error}. Please try again."}
-    except Exception as e: # Catch any other unexpected errors
-        logger.error(f"An unexpected error occurred during booking: {e}")
-        db.rollback() # Rollback in case of other errors
-        return {"error": f"An unexpected error occurred during booking: {e}. Please try again."}
-    finally:
-        db.close()
+        monday = _week_start(requested_date)
+        week_busy_by_calendar = {}
+        if gcal_service:
+            calendar_ids = {doc.email for doc in doctors if doc.email}
+            for calendar_id in calendar_ids:
+                busy_periods = _week_busy_cache.get((calendar_id, monday))
+                if busy_periods is not None:
+                    week_busy_by_calendar[calendar_id] = busy_periods
+            # One freebusy request for every doctor whose week isn't cached yet
+            uncached_ids = [cid for cid in calendar_ids if cid not in week_busy_by_calendar]
+            if uncached_ids:
+                # Failed calendars are absent from the result, so only real answers get cached
+                busy_by_calendar = await aget_free_busy_slots_for_calendars(gcal_service, uncached_ids, monday, monday + timedelta(days=7))
+                for calendar_id, busy_periods in busy_by_calendar.items():
+                    _week_busy_cache[(calendar_id, monday)] = busy_periods
+                week_busy_by_calendar.update(busy_by_calendar)
+
+        doctors_availability = []
+        for doc in doctors:
+            occupied_mask = booked_by_doctor.get(doc.id, 0)
+            if gcal_service and doc.email:
+                week_busy = week_busy_by_calendar.get(doc.email)
+                if week_busy is None:
+                    doctors_availability.append({
+                        "doctor_name": doc.name,
+                        "specialty": doc.specialty,
+                        "error": "Could not retrieve Google Calendar availability for this doctor. Please try again later.",
+                    })
+                    continue
+                occupied_mask |= _busy_mask_on(week_busy, requested_date)
+            doctors_availability.append({
+                "doctor_name": doc.name,
+                "specialty": doc.specialty,
+                "available_slots": _available_slots(occupied_mask),
+            })
+
+        return {"date": date, "doctors": doctors_availability}
 
 # NEW TOOL: List all Doctors
 async def list_all_doctors_tool(user_info: Dict = None) -> Dict: # user_info is optional for consistency
@@ -251,17 +491,12 @@ async def list_all_doctors_tool(user_info: Dict = None) -> Dict: # user_info is
     Lists all available doctors in the system with their names and specialties.
     Useful when a user wants to see who they can book an appointment with.
     """
-    db_gen = _get_db_session()
-    db = next(db_gen)
-
-    try:
-        doctors_data = _get_all_doctors(db)
+    with SessionLocal() as db:
+        doctors_data = await run_in_threadpool(_get_all_doctors, db)
         if not doctors_data:
             return {"message": "No doctors found in the system at the moment."}
 
         return {"doctors": doctors_data}
-    finally:
-        db.close()
     
 async def get_doctor_summary_report_tool(
     doctor_name: str,
@@ -283,11 +518,8 @@ async def get_doctor_summary_report_tool(
 
     # logger.info(f"Access GRANTED for report. Role is: {user_info.get('role')}")
     
-    db_gen = _get_db_session()
-    db = next(db_gen)
-
-    try:
-        doctor = _get_doctor_by_name(db, doctor_name)
+    with SessionLocal() as db:
+        doctor = await _aget_doctor_by_name(db, doctor_name)
         if not doctor:
             return {"error": f"Doctor '{doctor_name}' not found."}
 
@@ -300,10 +532,14 @@ async def get_doctor_summary_report_tool(
             except ValueError:
                 return {"error": "Invalid date format for daily report. Use `YYYY-MM-DD`."}
 
-            appointments_on_date = db.query(models.Appointment).filter(
-                models.Appointment.doctor_id == doctor.id,
-                models.Appointment.appointment_date == report_date
-            ).all()
+            appointments_on_date = await run_in_threadpool(
+                db.query(models.Appointment).options(
+                    selectinload(models.Appointment.patient) # One query for all patients instead of one per row
+                ).filter(
+                    models.Appointment.doctor_id == doctor.id,
+                    models.Appointment.appointment_date == report_date
+                ).all
+            )
 
             summary_data["date"] = report_date_str
             summary_data["appointments_count"] = len(appointments_on_date)
@@ -314,10 +550,14 @@ async def get_doctor_summary_report_tool(
             summary_data["message"] = f"On {report_date_str}, {doctor.name} has {len(appointments_on_date)} appointments."
 
         elif report_type == "total_patients":
-            total_patients_visited = db.query(models.Appointment).filter(
-                models.Appointment.doctor_id == doctor.id,
-                models.models.Appointment.status == "completed"
-            ).count()
+            # Flat SELECT count(*) ... WHERE, rather than Query.count()'s count over a subquery
+            total_patients_visited = await run_in_threadpool(
+                db.scalar,
+                select(func.count()).select_from(models.Appointment).where(
+                    models.Appointment.doctor_id == doctor.id,
+                    models.Appointment.status == "completed"
+                )
+            )
             summary_data["total_patients_visited"] = total_patients_visited
             summary_data["message"] = f"{doctor.name} has had {total_patients_visited} patients completed appointments."
 
@@ -333,6 +573,4 @@ async def get_doctor_summary_report_tool(
                     logger.info(f"  - {app['time_slot']} with {app['patient_name']} ({app['status']})")
             logger.info(f"---------------------------\n")
 
-        return summary_data
-    finally:
-        db.close()
\ No newline at end of file
+        return summary_data
\ No newline at end of file
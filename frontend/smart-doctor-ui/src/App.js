@@ -29,7 +29,7 @@ function App() {
   const [showInstructions, setShowInstructions] = useState(true);
 
   const BACKEND_BASE_URL = 'https://smart-doctor-backend-api-gautam.onrender.com'; // change for local deployment as 'http://127.0.0.1:8000' 'https://smart-doctor-backend-api-gautam.onrender.com'
-  const CHAT_URL = `${BACKEND_BASE_URL}/chat/`; 
+  const CHAT_STREAM_URL = `${BACKEND_BASE_URL}/chat/stream/`;
   const HISTORY_URL = `${BACKEND_BASE_URL}/history/`;
 
   // Pre-registered Doctor for instructions
@@ -167,6 +167,55 @@ function App() {
     setMessages([{ role: 'ai', content: "You have been logged out. Please log in or register." }]);
   };
 
+  // Posts a message to the streaming chat endpoint and renders the AI reply as server-sent events arrive
+  const streamChatReply = async (userMessage) => {
+    const response = await fetch(CHAT_STREAM_URL, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'Authorization': `Bearer ${token}`
+      },
+      body: JSON.stringify({
+        user_message: userMessage
+      }),
+    });
+
+    if (!response.ok) {
+      if (response.status === 401 || response.status === 403) {
+        handleLogout();
+        throw new Error('Session expired or unauthorized. Please log in again.');
+      }
+      const errorData = await response.json();
+      throw new Error(errorData.detail || `HTTP error! Status: ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let replyStarted = false;
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const events = buffer.split('\n\n');
+      buffer = events.pop(); // Keep a partially received event for the next read
+      for (const event of events) {
+        if (!event.startsWith('data: ')) continue;
+        const payload = JSON.parse(event.slice(6));
+        if (payload.type === 'error') {
+          throw new Error(payload.detail);
+        }
+        if (payload.type === 'output') {
+          const isFirstChunk = !replyStarted;
+          replyStarted = true;
+          setMessages((prevMessages) => isFirstChunk
+            ? [...prevMessages, { role: 'ai', content: payload.content }]
+            : [...prevMessages.slice(0, -1), { role: 'ai', content: prevMessages[prevMessages.length - 1].content + payload.content }]);
+        }
+      }
+    }
+  };
+
   const sendMessage = async () => {
     if (inputMessage.trim() === '' || isLoading || !isLoggedIn) return;
 
@@ -177,33 +226,7 @@ function App() {
     setIsLoading(true);
 
     try {
-      const chatHistoryForBackend = messages
-        .filter(msg => msg.role === 'human' || msg.role === 'ai')
-        .map(msg => ({ role: msg.role, content: msg.content }));
-
-      const response = await fetch(CHAT_URL, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'Authorization': `Bearer ${token}`
-        },
-        body: JSON.stringify({
-          user_message: newMessage.content,
-          chat_history: chatHistoryForBackend
-        }),
-      });
-
-      if (!response.ok) {
-        if (response.status === 401 || response.status === 403) {
-          handleLogout();
-          throw new Error('Session expired or unauthorized. Please log in again.');
-        }
-        const errorData = await response.json();
-        throw new Error(errorData.detail || `HTTP error! Status: ${response.status}`);
-      }
-
-      const data = await response.json();
-      setMessages(data.updated_chat_history);
+      await streamChatReply(newMessage.content);
 
     } catch (error) {
       console.error('Error sending message:', error);
@@ -233,33 +256,7 @@ function App() {
     setIsLoading(true);
 
     try {
-      const chatHistoryForBackend = messages
-        .filter(msg => msg.role === 'human' || msg.role === 'ai')
-        .map(msg => ({ role: msg.role, content: msg.content }));
-
-      const response = await fetch(CHAT_URL, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'Authorization': `Bearer ${token}`
-        },
-        body: JSON.stringify({
-          user_message: reportMessage,
-          chat_history: chatHistoryForBackend
-        }),
-      });
-
-      if (!response.ok) {
-        if (response.status === 401 || response.status === 403) {
-          handleLogout();
-          throw new Error('Session expired or unauthorized. Please log in again.');
-        }
-        const errorData = await response.json();
-        throw new Error(errorData.detail || `HTTP error! Status: ${response.status}`);
-      }
-
-      const data = await response.json();
-      setMessages(data.updated_chat_history);
+      await streamChatReply(reportMessage);
       
     } catch (error) {
       console.error('Error requesting doctor report:', error);